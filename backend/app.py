@@ -1,12 +1,20 @@
 import os
+import json
+import uuid
 import logging
 import subprocess
 import time
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from backend.config import Config
 from main import orchestrate_process
+from backend.vision_analysis import registry as vision_registry, warm_up as warm_up_vision_models
+from backend.nvidia_api import session_stats as llm_session_stats
+from cache import cache_stats  # imported the way the pipeline modules import it, so the counters are shared
+from metrics import render as render_metrics
+from office_pool import warm_up as warm_up_office_pool
+from backend.jobs import Job, JobManager
 
 # ensure necessary directories exist
 os.makedirs(Config.OUTPUT_FOLDER, exist_ok=True)
@@ -22,12 +30,13 @@ CORS(app)
 
 app.config.from_object(Config)
 
-# track the current state of processing
-processing_state = {
-    "is_processing": False,
-    "should_continue": True,
-    "current_slide": 0
-}
+if Config.VISION_WARM_START:
+    warm_up_vision_models()
+if Config.OFFICE_WARM_START:
+    warm_up_office_pool()
+
+# each upload becomes a job with its own state, run on a bounded worker pool
+job_manager = JobManager(orchestrate_process)
 
 @app.route('/')
 def index():
@@ -43,21 +52,86 @@ def allowed_file(filename):
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if processing_state["is_processing"]:
-        return jsonify({"error": "already processing a file."}), 400
-
-    file = request.files['presentation']
+    file = request.files.get('presentation')
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        job_id = uuid.uuid4().hex
+        # every job gets its own upload and output folders so concurrent decks don't collide
+        upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+        output_folder = os.path.join(app.config['OUTPUT_FOLDER'], job_id)
+        os.makedirs(upload_folder, exist_ok=True)
+        os.makedirs(output_folder, exist_ok=True)
+        file_path = os.path.join(upload_folder, filename)
         file.save(file_path)
-        processing_state["is_processing"] = True
-        processing_state["should_continue"] = True
-        result = orchestrate_process(file_path, app.config['OUTPUT_FOLDER'], processing_state)
-        processing_state["is_processing"] = False
-        return jsonify(result)
+        job = job_manager.submit(Job(file_path, output_folder, job_id=job_id))
+        return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
     return jsonify({"error": "Invalid file or no file uploaded."}), 400
 
+@app.route('/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in job_manager.list()])
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """server-sent events with the start/end of every pipeline stage of a job, ending with a "done" event"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found."}), 404
+
+    def stream(since):
+        while True:
+            events = job.wait_for_events(since, timeout=Config.SSE_KEEPALIVE_SECONDS)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "done":
+                    return
+            since += len(events)
+
+    # a reconnecting EventSource resumes after the last event it received
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_event_id = -1  # a malformed header replays the stream from the start
+    since = last_event_id + 1
+    return Response(stream(since), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "job not found."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/models/metrics')
+def model_metrics():
+    """load and inference timings of the vision models"""
+    return jsonify(vision_registry.metrics())
+
+@app.route('/llm/metrics')
+def llm_metrics():
+    """latency, token and retry statistics of the LLM session"""
+    return jsonify(llm_session_stats())
+
+@app.route('/cache/stats')
+def cache_statistics():
+    """hit/miss counters of the result caches"""
+    return jsonify(cache_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """stage timings and counters in the prometheus text exposition format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/stop-audio2face', methods=['POST'])
 def stop_audio2face():
     try:
@@ -88,10 +162,8 @@ def stop_audio2face():
         ]
         subprocess.run(curl_cmd, check=True)
         
-        # reset the processing state
-        processing_state["is_processing"] = False
-        processing_state["should_continue"] = False
-        processing_state["current_slide"] = 0
+        # stop every running presentation, they were playing on the instance that was just restarted
+        job_manager.cancel_all()
 
         return jsonify({"message": "Audio2Face restarted successfully."})
     except subprocess.CalledProcessError as e:
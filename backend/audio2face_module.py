@@ -1,5 +1,8 @@
 import sys
+import atexit
+import threading
 import grpc
+import grpc.aio
 import numpy as np
 import soundfile
 from pathlib import Path
@@ -8,46 +11,208 @@ import os
 
 import audio2face_pb2
 import audio2face_pb2_grpc
+from config import Config
+from metrics import timed, count
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 host_ip = os.getenv('HOST_IP_ADDRESS')
-def push_audio_to_audio2face(audio_path, instance_name, url=f"{host_ip}:50051"):
+DEFAULT_URL = f"{host_ip}:50051"
+
+def channel_options():
+    return [
+        # Increased maximum message sizes for send and receive
+        ('grpc.max_send_message_length', 500 * 1024 * 1024),  # 500 MB
+        ('grpc.max_receive_message_length', 500 * 1024 * 1024),  # 500 MB
+        # keepalive pings only stop an idle connection from being dropped by proxies and nats over
+        # long pauses between decks; servers reject pings more frequent than every 5 minutes, far
+        # too slow to notice a dead connection between slides. a push finds out quickly anyway,
+        # since every call waits for the channel to be ready only until its own deadline
+        ('grpc.keepalive_time_ms', int(Config.A2F_KEEPALIVE_SECONDS * 1000)),
+        ('grpc.keepalive_timeout_ms', int(Config.A2F_KEEPALIVE_TIMEOUT * 1000)),
+        ('grpc.keepalive_permit_without_calls', 1),
+        ('grpc.http2.max_pings_without_data', 0),
+        # a lost connection is re-established in the background with exponential backoff
+        ('grpc.initial_reconnect_backoff_ms', int(Config.A2F_RECONNECT_BACKOFF * 1000)),
+        ('grpc.max_reconnect_backoff_ms', int(Config.A2F_MAX_RECONNECT_BACKOFF * 1000)),
+    ]
+
+def push_timeout(seconds_of_audio):
+    """deadline of a push that blocks until playback is finished"""
+    if seconds_of_audio is None:
+        return Config.A2F_STREAM_TIMEOUT
+    return seconds_of_audio + Config.A2F_TIMEOUT_MARGIN
+
+class Audio2FaceClient:
+    """a long-lived audio2face connection: one grpc channel shared by every push.
+
+    the channel keeps its http/2 connection open between slides and reconnects with
+    backoff when it drops; calls wait for the reconnect (wait_for_ready) until their
+    deadline instead of failing at once. every call's latency is recorded as the
+    audio2face_rpc stage. safe to use from several threads.
+    """
+    def __init__(self, url=DEFAULT_URL):
+        self.url = url
+        self.channel = grpc.insecure_channel(url, options=channel_options())
+        self.stub = audio2face_pb2_grpc.Audio2FaceStub(self.channel)
+
+    def push(self, data, samplerate, instance_name, block_until_playback_is_finished=True, timeout=None):
+        """sends a whole mono float32 clip with PushAudio, returns the response"""
+        request = audio2face_pb2.PushAudioRequest(
+            audio_data=np.ascontiguousarray(data, dtype=np.float32).tobytes(),
+            samplerate=samplerate,
+            instance_name=instance_name,
+            block_until_playback_is_finished=block_until_playback_is_finished
+        )
+        with timed("audio2face_rpc", rpc="PushAudio"):
+            return self.stub.PushAudio(request, timeout=timeout or push_timeout(len(data) / samplerate), wait_for_ready=True)
+
+    def push_stream(self, chunks, samplerate, instance_name, block_until_playback_is_finished=True, timeout=None):
+        """streams float32 chunks with PushAudioStream, returns the response"""
+        with timed("audio2face_rpc", rpc="PushAudioStream"):
+            return self.stub.PushAudioStream(stream_requests(chunks, samplerate, instance_name, block_until_playback_is_finished),
+                                             timeout=timeout or push_timeout(None), wait_for_ready=True)
+
+    def close(self):
+        self.channel.close()
+
+class AsyncAudio2FaceClient:
+    """grpc.aio version of Audio2FaceClient for callers running an asyncio event loop.
+
+    create it inside the loop it is used from; the channel belongs to that loop.
+    """
+    def __init__(self, url=DEFAULT_URL):
+        self.url = url
+        self.channel = grpc.aio.insecure_channel(url, options=channel_options())
+        self.stub = audio2face_pb2_grpc.Audio2FaceStub(self.channel)
+
+    async def push(self, data, samplerate, instance_name, block_until_playback_is_finished=True, timeout=None):
+        request = audio2face_pb2.PushAudioRequest(
+            audio_data=np.ascontiguousarray(data, dtype=np.float32).tobytes(),
+            samplerate=samplerate,
+            instance_name=instance_name,
+            block_until_playback_is_finished=block_until_playback_is_finished
+        )
+        with timed("audio2face_rpc", rpc="PushAudio"):
+            return await self.stub.PushAudio(request, timeout=timeout or push_timeout(len(data) / samplerate), wait_for_ready=True)
+
+    async def push_stream(self, chunks, samplerate, instance_name, block_until_playback_is_finished=True, timeout=None):
+        """chunks may be a regular or an async iterable"""
+        async def requests():
+            yield start_request(samplerate, instance_name, block_until_playback_is_finished)
+            if hasattr(chunks, '__aiter__'):
+                async for chunk in chunks:
+                    yield chunk_request(chunk)
+            else:
+                for chunk in chunks:
+                    yield chunk_request(chunk)
+        with timed("audio2face_rpc", rpc="PushAudioStream"):
+            return await self.stub.PushAudioStream(requests(), timeout=timeout or push_timeout(None), wait_for_ready=True)
+
+    async def close(self):
+        await self.channel.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(url=DEFAULT_URL):
+    """the process's shared client for an audio2face address"""
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = Audio2FaceClient(url)
+        return _clients[url]
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+atexit.register(close_clients)
+
+@timed("push_audio_to_audio2face")
+def push_audio_to_audio2face(audio_path, instance_name, url=DEFAULT_URL):
+    """sends a wav file in one PushAudio call, returns True on success"""
     try:
         if not os.path.exists(audio_path):
             logging.error(f"audio file {audio_path} does not exist.")
-            return
+            return False
         
         data, samplerate = soundfile.read(audio_path, dtype='float32')
         if data.ndim > 1:
             data = np.mean(data, axis=1)
 
-        # Increased maximum message sizes for send and receive
-        options = [
-            ('grpc.max_send_message_length', 500 * 1024 * 1024),  # 500 MB
-            ('grpc.max_receive_message_length', 500 * 1024 * 1024)  # 500 MB
-        ]
-        with grpc.insecure_channel(url, options=options) as channel:
-            stub = audio2face_pb2_grpc.Audio2FaceStub(channel)
-            request = audio2face_pb2.PushAudioRequest(
-                audio_data=data.tobytes(),
-                samplerate=samplerate,
-                instance_name=instance_name,
-                block_until_playback_is_finished=True
-            )
-            logging.info("Attempting to send audio data to Audio2Face...")
-            response = stub.PushAudio(request)
-            if response.success:
-                logging.info("Audio successfully sent to Audio2Face.")
-            else:
-                logging.error(f"Failed to send audio: {response.message}")
+        logging.info("Attempting to send audio data to Audio2Face...")
+        response = get_client(url).push(data, samplerate, instance_name)
+        if response.success:
+            logging.info("Audio successfully sent to Audio2Face.")
+            return True
+        logging.error(f"Failed to send audio: {response.message}")
     except grpc.RpcError as e:
         logging.error(f"gRPC error: {e.details()} (code: {e.code()})")
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
+    count("clara_audio2face_push_failures_total", help="audio2face pushes that did not succeed", rpc="PushAudio")
+    return False
+
+def read_audio_chunks(audio_path, chunk_size=Config.A2F_STREAM_CHUNK_SIZE):
+    """yield mono float32 chunks of a wav file without loading the whole file"""
+    for block in soundfile.blocks(audio_path, blocksize=chunk_size, dtype='float32', always_2d=True):
+        yield np.mean(block, axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0]
+
+def start_request(samplerate, instance_name, block_until_playback_is_finished=True):
+    return audio2face_pb2.PushAudioStreamRequest(
+        start_marker=audio2face_pb2.PushAudioRequestStart(
+            instance_name=instance_name,
+            samplerate=samplerate,
+            block_until_playback_is_finished=block_until_playback_is_finished
+        )
+    )
+
+def chunk_request(chunk):
+    return audio2face_pb2.PushAudioStreamRequest(audio_data=np.ascontiguousarray(chunk, dtype=np.float32).tobytes())
+
+def stream_requests(chunks, samplerate, instance_name, block_until_playback_is_finished=True):
+    """build the PushAudioStream request sequence: a start marker followed by raw float32 chunks"""
+    yield start_request(samplerate, instance_name, block_until_playback_is_finished)
+    for chunk in chunks:
+        yield chunk_request(chunk)
+
+@timed("push_audio_chunks_to_audio2face")
+def push_audio_chunks_to_audio2face(chunks, samplerate, instance_name, url=DEFAULT_URL, timeout=None):
+    """streams an iterable of float32 chunks to audio2face, returns True on success"""
+    try:
+        logging.info("Attempting to stream audio data to Audio2Face...")
+        response = get_client(url).push_stream(chunks, samplerate, instance_name, timeout=timeout)
+        if response.success:
+            logging.info("Audio successfully streamed to Audio2Face.")
+            return True
+        logging.error(f"Failed to stream audio: {response.message}")
+    except grpc.RpcError as e:
+        logging.error(f"gRPC error: {e.details()} (code: {e.code()})")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    count("clara_audio2face_push_failures_total", help="audio2face pushes that did not succeed", rpc="PushAudioStream")
+    return False
+
+def push_audio_stream_to_audio2face(audio_path, instance_name, url=DEFAULT_URL, chunk_size=Config.A2F_STREAM_CHUNK_SIZE):
+    """streaming variant of push_audio_to_audio2face using the PushAudioStream rpc.
+
+    the wav is read incrementally with soundfile.blocks, so memory stays bounded by
+    chunk_size and audio2face can start playback as soon as the first chunk arrives.
+    """
+    if not os.path.exists(audio_path):
+        logging.error(f"audio file {audio_path} does not exist.")
+        return False
+    info = soundfile.info(audio_path)
+    return push_audio_chunks_to_audio2face(read_audio_chunks(audio_path, chunk_size), info.samplerate, instance_name, url=url,
+                                           timeout=push_timeout(info.duration))
 
 def main(audio_path, instance_name):
-    push_audio_to_audio2face(audio_path, instance_name)
+    if Config.A2F_STREAMING:
+        push_audio_stream_to_audio2face(audio_path, instance_name)
+    else:
+        push_audio_to_audio2face(audio_path, instance_name)
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -0,0 +1,116 @@
+import json
+import logging
+import threading
+from config import Config
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """returns the tiktoken encoding used for budgeting, or None if it can't be loaded (e.g. offline)"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(Config.LLM_TOKENIZER_ENCODING)
+            except Exception as e:
+                logging.warning(f"tiktoken unavailable ({e}), estimating tokens from character counts.")
+                _encoding = False
+        return _encoding or None
+
+def count_tokens(text):
+    """approximate mixtral token count of text (tiktoken count scaled by Config.LLM_TOKEN_SAFETY_FACTOR)"""
+    encoding = get_encoding()
+    tokens = len(encoding.encode(text)) if encoding else len(text) / 4
+    return int(tokens * Config.LLM_TOKEN_SAFETY_FACTOR) + 1
+
+def serialize_slides(slides):
+    """the slides as they go into the prompt: compact json, no whitespace spent on indentation"""
+    return json.dumps(slides, separators=(',', ':'))
+
+def slide_tokens(slide):
+    # each slide is serialized as one element of the input array
+    return count_tokens(serialize_slides([slide]))
+
+def fit_slide(slide, max_tokens):
+    """slide trimmed to at most max_tokens of payload.
+
+    a slide that is too large keeps only its number and text (detections and layout are
+    dropped), and the text is cut until it fits.
+    """
+    tokens = slide_tokens(slide)
+    if tokens <= max_tokens:
+        return slide
+    text = str(slide.get("text") or "")
+    fitted = {"slide_number": slide.get("slide_number"), "text": text}
+    tokens = slide_tokens(fitted)
+    while tokens > max_tokens and text:
+        # cut in proportion to the excess, a little more so it converges in a few rounds
+        text = text[:max(0, int(len(text) * max_tokens / tokens * 0.95))]
+        fitted["text"] = text
+        tokens = slide_tokens(fitted)
+    return fitted
+
+def max_output_tokens(prompt_tokens, num_slides):
+    """response budget of a batch: whatever the context window leaves after the prompt, capped at
+    Config.LLM_MAX_OUTPUT_TOKENS and never below the expected output of its slides"""
+    available = Config.LLM_CONTEXT_TOKENS - prompt_tokens
+    return max(min(Config.LLM_MAX_OUTPUT_TOKENS, available), num_slides * Config.LLM_OUTPUT_TOKENS_PER_SLIDE)
+
+class BatchPlanner:
+    """packs slides into LLM batches that fit a token budget.
+
+    a batch's cost is the instruction tokens, plus each slide's serialized payload, plus the
+    expected output per slide; slides are added in order until the next one would exceed
+    the budget. a single slide that is larger than the budget is trimmed with fit_slide and
+    gets a batch of its own.
+    """
+    def __init__(self, instruction_tokens, budget=Config.LLM_TOKEN_BUDGET, output_tokens_per_slide=Config.LLM_OUTPUT_TOKENS_PER_SLIDE,
+                 max_slides=Config.LLM_MAX_BATCH_SLIDES, first_batch_max_slides=Config.LLM_FIRST_BATCH_MAX_SLIDES):
+        self.instruction_tokens = instruction_tokens
+        self.budget = budget
+        self.output_tokens_per_slide = output_tokens_per_slide
+        self.max_slides = max_slides
+        self.first_batch_max_slides = first_batch_max_slides
+        self.batch = []
+        self.payload_tokens = 0
+        self.report = []
+
+    def _cost(self, payload_tokens, num_slides):
+        return self.instruction_tokens + payload_tokens + num_slides * self.output_tokens_per_slide
+
+    def _slide_limit(self):
+        return self.first_batch_max_slides if not self.report else self.max_slides
+
+    def add(self, slide):
+        """adds a slide, returning the batch that had to be closed to make room for it (or None)"""
+        tokens = slide_tokens(slide)
+        if self._cost(tokens, 1) > self.budget:
+            logging.warning(f"slide {slide.get('slide_number')} alone needs ~{self._cost(tokens, 1)} tokens, over the budget of {self.budget}, trimming it.")
+            slide = fit_slide(slide, self.budget - self._cost(0, 1))
+            tokens = slide_tokens(slide)
+        closed = None
+        if self.batch and (len(self.batch) >= self._slide_limit() or self._cost(self.payload_tokens + tokens, len(self.batch) + 1) > self.budget):
+            closed = self.flush()
+        self.batch.append(slide)
+        self.payload_tokens += tokens
+        if len(self.batch) >= self._slide_limit():
+            return closed or self.flush()
+        return closed
+
+    def flush(self):
+        """closes and returns the current batch (or None if it's empty), recording its token counts"""
+        if not self.batch:
+            return None
+        batch = self.batch
+        entry = {
+            "slides": [slide["slide_number"] for slide in batch],
+            "prompt_tokens": self.instruction_tokens + self.payload_tokens,
+            "expected_output_tokens": len(batch) * self.output_tokens_per_slide,
+        }
+        self.report.append(entry)
+        logging.info(f"llm batch {len(self.report) - 1}: slides {entry['slides']}, ~{entry['prompt_tokens']} prompt tokens, ~{entry['expected_output_tokens']} expected output tokens")
+        self.batch = []
+        self.payload_tokens = 0
+        return batch
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from config import Config
+from metrics import count
+from utils import atomic_write
+
+def hash_bytes(*parts):
+    """sha256 over the given byte strings, used as a content address"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+def hash_json(obj):
+    """hash of the canonical json form of obj (sorted keys, no whitespace)"""
+    return hash_bytes(json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_json_default).encode('utf-8'))
+
+def _json_default(value):
+    # numpy scalars/arrays from the vision models
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"object of type {type(value).__name__} is not JSON serializable")
+
+class ResultCache:
+    """persistent content-addressed cache on disk with size-bounded lru eviction.
+
+    entries are stored as one file per key under a namespace directory. reads touch the
+    file's mtime, so eviction removes the least recently used files once the directory
+    grows past max_bytes. writes go through a temp file and os.replace, so concurrent
+    readers never see a partial entry.
+    """
+    def __init__(self, namespace, directory=Config.CACHE_FOLDER, max_bytes=Config.CACHE_MAX_BYTES):
+        self.namespace = namespace
+        self.directory = os.path.join(directory, namespace)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.startswith('.tmp-'))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get_bytes(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            count("clara_cache_requests_total", help="result cache lookups", namespace=self.namespace, result="miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        count("clara_cache_requests_total", help="result cache lookups", namespace=self.namespace, result="hit")
+        return data
+
+    def put_bytes(self, key, data):
+        path = self._path(key)
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        atomic_write(path, data)
+        with self._lock:
+            self._size += len(data) - previous_size
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def get_json(self, key):
+        data = self.get_bytes(key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key, value):
+        self.put_bytes(key, json.dumps(value, default=_json_default).encode('utf-8'))
+
+    def evict(self):
+        """removes least recently used entries until the namespace fits max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith('.tmp-'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            self._size = total
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                logging.debug(f"evicted cache entry {path}")
+                if total <= self.max_bytes:
+                    break
+            self._size = total
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(namespace, max_bytes=Config.CACHE_MAX_BYTES):
+    """returns the shared cache for a namespace (one instance per process), or None when caching is disabled"""
+    if not Config.CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = ResultCache(namespace, max_bytes=max_bytes)
+        return _caches[namespace]
+
+def cache_stats():
+    with _caches_lock:
+        return {namespace: cache.stats() for namespace, cache in _caches.items()}
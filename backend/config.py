@@ -8,20 +8,95 @@ class Config:
     MODELS_FOLDER = os.path.join(BASE_DIR, 'models')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB limit
     
+    JOB_MAX_WORKERS = 2  # presentations processed at the same time, bounded by GPU memory and cores
+    JOB_HISTORY = 100  # finished jobs kept for status queries
+    SSE_KEEPALIVE_SECONDS = 15  # idle time before a keepalive comment is sent on an event stream
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'  # stage timers and counters exported at /metrics
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)  # seconds
+    
     GOOGLE_APPLICATION_CREDENTIALS = '' # /path/to/your/service-account-file.json
     GOOGLE_TTS_LANGUAGE_CODE = 'en-US'
     GOOGLE_TTS_VOICE_NAME = 'en-US-Wavenet-F'
     GOOGLE_TTS_SSML_GENDER = 'FEMALE'
     GOOGLE_TTS_AUDIO_ENCODING = 'LINEAR16'
     
+    ELEVENLABS_VOICE_ID = 'voice_id_you_want_to_use'
+    ELEVENLABS_MODEL = 'eleven_multilingual_v2'
+    
+    INCREMENTAL_REPROCESSING = True  # on a re-upload of a deck, only process the slides that changed (requires CACHE_ENABLED)
+    PPTX_NATIVE_EXTRACTION = True  # read slide text from the pptx xml, only rasterize slides with pictures or charts
+    LIBREOFFICE_PROFILE_FOLDER = os.path.join(BASE_DIR, 'libreoffice_profiles')  # one profile per concurrent conversion
+    CONVERSION_TIMEOUT = 120  # seconds for libreoffice to convert one presentation
+    OFFICE_POOL_SIZE = JOB_MAX_WORKERS  # warm libreoffice listeners driven over uno, 0 starts a new libreoffice per conversion
+    OFFICE_WARM_START = False  # start the listeners when the app starts instead of on the first conversion
+    OFFICE_START_TIMEOUT = 60  # seconds for a listener to accept uno connections
+    OFFICE_HEALTH_TIMEOUT = 5  # seconds for a listener to answer its health check before it is restarted
+    OFFICE_MAX_CONVERSIONS = 200  # a listener is restarted after this many documents to bound its memory
+    
     PDF_CONVERSION_DENSITY = '150'
     PDF_CONVERSION_FORMAT = 'png'
+    PDF_RASTERIZER = 'pdfium'  # in-process parallel rendering with pypdfium2, or 'imagemagick'
+    RASTER_MAX_WORKERS = min(4, os.cpu_count())
+    RASTER_WRITE_THROUGH = False  # also save the rendered slides to the image folder, for debugging
     
     OCR_TIMEOUT = 60  # seconds
     OCR_MAX_WORKERS = min(8, os.cpu_count() - 1)
     
     NVIDIA_MODEL_NAME = 'mistralai/mixtral-8x22b-instruct-v0.1'
+    NVIDIA_BASE_URL = os.getenv('NVIDIA_BASE_URL')  # None uses the hosted NIM endpoint, set to a local OpenAI-compatible server for testing
+    LLM_SYSTEM_PROMPT = True  # send the instructions as a system message so the server can cache the prefix
+    LLM_MAX_RETRIES = 3
+    LLM_RETRY_BACKOFF = 1.0  # seconds, doubled after every failed attempt
+    LLM_HTTP_POOL_SIZE = 8
+    LLM_SLIDE_RETRIES = 2  # times a slide missing from a response is re-requested on its own
+    LLM_MAX_IN_FLIGHT = 3  # LLM batches generated concurrently
+    LLM_CONTEXT_SLIDES = 3  # preceding slides summarized for a batch's continuity hint
+    LLM_CONTEXT_CHARS_PER_SLIDE = 200
+    LLM_METRICS_HISTORY = 500  # recent requests kept for /llm/metrics
     PADDLEOCR_USE_GPU = True
     PADDLEOCR_LANG = 'en'
     PADDLEOCR_USE_ANGLE_CLS = True
     PADDLEOCR_USE_CUDNN = True
+    LAYOUT_OCR = False  # let ppstructure recognize region text itself instead of reusing the tesseract lines
+    TESSERACT_LANG = 'eng'
+    
+    A2F_INSTANCE_NAMES = ['/World/audio2face/PlayerStreaming']  # streaming player instances, each plays one job at a time
+    A2F_STREAMING = True  # use the PushAudioStream rpc instead of a single PushAudio message
+    A2F_STREAM_CHUNK_SIZE = 8192  # samples per streamed audio chunk
+    A2F_KEEPALIVE_SECONDS = 300  # keepalive ping interval of the audio2face channel, servers reject pings more frequent than 5 minutes by default
+    A2F_KEEPALIVE_TIMEOUT = 20  # seconds without a ping ack before the connection is considered dead
+    A2F_RECONNECT_BACKOFF = 0.5  # seconds before the first reconnect attempt, grows up to A2F_MAX_RECONNECT_BACKOFF
+    A2F_MAX_RECONNECT_BACKOFF = 10
+    A2F_TIMEOUT_MARGIN = 30  # seconds a push may take beyond the length of its audio (pushes block until playback is finished)
+    A2F_STREAM_TIMEOUT = 900  # deadline of a streamed push whose length isn't known up front
+    
+    LLM_CONTEXT_TOKENS = 65536  # Mixtral 8x22B context window
+    LLM_TOKEN_BUDGET = 60000  # prompt + expected output tokens a batch may use, leaves headroom below the context window
+    LLM_OUTPUT_TOKENS_PER_SLIDE = 1200  # expected script length per slide
+    LLM_MAX_OUTPUT_TOKENS = 40536
+    LLM_MAX_BATCH_SLIDES = 20
+    LLM_FIRST_BATCH_MAX_SLIDES = 5  # keep the first batch small so speech starts early
+    LLM_PAYLOAD_COMPACTOR = 'compact'  # 'compact' or 'full', see backend/payload.py
+    LLM_PAYLOAD_MIN_CONFIDENCE = 0.5  # detections/recognitions below this are not sent to the LLM
+    LLM_PAYLOAD_BBOX_STEP = 10  # pixels, bounding boxes are rounded to this grid
+    LLM_TOKENIZER_ENCODING = 'cl100k_base'  # tiktoken approximation of the Mixtral tokenizer
+    LLM_TOKEN_SAFETY_FACTOR = 1.2  # Mixtral's tokenizer produces more tokens than cl100k_base
+    LLM_STREAMING = True  # stream responses and hand each slide's script to TTS as soon as it is complete
+    PIPELINE_QUEUE_SIZE = 5  # max items buffered between pipeline stages
+    PIPELINE_POLL_INTERVAL = 0.5  # seconds between cancellation checks while a stage waits
+    
+    VISION_DEVICE = 'cuda'  # torch device for YOLO, falls back to cpu when cuda is unavailable
+    VISION_WARM_START = False  # load the vision models when the app starts instead of on the first slide
+    VISION_WARM_START_MODELS = ['yolo', 'layout']
+    VISION_BATCH_SIZE = 8  # slides per batched yolo call
+    
+    CACHE_ENABLED = True  # reuse OCR, vision and LLM results for unchanged slides
+    CACHE_FOLDER = os.path.join(BASE_DIR, 'cache')
+    CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # per namespace, least recently used entries are evicted past this
+    TTS_MAX_WORKERS = 4  # concurrent TTS requests
+    TTS_RATE_LIMIT = 5  # max TTS requests started per second, 0 disables the limit
+    TTS_LOOKAHEAD = 6  # slides that may be synthesized ahead of playback
+    TTS_INCREMENTAL = False  # synthesize sentence by sentence and stream each piece to Audio2Face (only with A2F_STREAMING, otherwise whole slides are synthesized)
+    TTS_SENTENCE_MAX_CHARS = 300  # longer sentences are split at clause boundaries
+    TTS_DEFAULT_SAMPLERATE = 24000
+    TTS_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # synthesized audio kept on disk, evicted by total bytes
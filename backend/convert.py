@@ -1,22 +1,63 @@
 import os
+import queue
+import pathlib
+import tempfile
 import subprocess
 import logging
-from utils import wait_for_file
+from config import Config
+from metrics import timed
+from office_pool import get_pool
 
+# one libreoffice profile per concurrent conversion. with a shared profile, a second
+# soffice hands its document to the instance already running and exits before the pdf exists
+_profiles = queue.Queue()
+for _slot in range(Config.JOB_MAX_WORKERS):
+    _profiles.put(os.path.join(Config.LIBREOFFICE_PROFILE_FOLDER, str(_slot)))
+
+@timed("convert_to_pdf")
 def convert_to_pdf(pptx_path, output_folder):
-    """converts PowerPoint to PDF"""
+    """converts PowerPoint to PDF.
+
+    libreoffice converts into a scratch directory, on a warm office listener (office_pool)
+    when uno is available and otherwise in a new process with a profile of its own, so the
+    pdf is complete when the conversion returns; it is then renamed into output_folder, so
+    anyone waiting for it never sees a partially written file.
+    """
     base_name = os.path.basename(pptx_path)
     pdf_name = base_name.rsplit('.', 1)[0] + '.pdf'
     pdf_path = os.path.join(output_folder, pdf_name)
-    
-    # convert PowerPoint to PDF specifying the output filename
-    subprocess.run(['libreoffice', '--headless', '--convert-to', 'pdf', '--outdir', output_folder, pptx_path], capture_output=True)
-    
-    # wait for the PDF to be available
-    pdf_ready = wait_for_file(pdf_path)
-    
-    if pdf_ready:
+
+    pool = get_pool()
+    if pool is not None:
+        with tempfile.TemporaryDirectory(dir=output_folder, prefix='.convert-') as scratch:
+            converted = os.path.join(scratch, pdf_name)
+            try:
+                if not pool.convert(pptx_path, converted):
+                    logging.error(f"PDF file was not created for {pptx_path}.")
+                    return None
+                os.replace(converted, pdf_path)
+                return pdf_path
+            except RuntimeError as e:
+                logging.warning(f"{e}, converting with a new libreoffice process instead.")
+    return convert_with_new_process(pptx_path, pdf_name, pdf_path, output_folder)
+
+def convert_with_new_process(pptx_path, pdf_name, pdf_path, output_folder):
+    """cold conversion: one libreoffice process per document, paying office startup every time"""
+    profile = _profiles.get()
+    try:
+        with tempfile.TemporaryDirectory(dir=output_folder, prefix='.convert-') as scratch:
+            # convert PowerPoint to PDF specifying the output filename
+            process = subprocess.run(['libreoffice', f'-env:UserInstallation={pathlib.Path(profile).as_uri()}', '--headless',
+                                      '--convert-to', 'pdf', '--outdir', scratch, pptx_path],
+                                     capture_output=True, timeout=Config.CONVERSION_TIMEOUT)
+            converted = os.path.join(scratch, pdf_name)
+            if process.returncode != 0 or not os.path.exists(converted):
+                logging.error(f"PDF file was not created (exit code {process.returncode}): {process.stderr.decode('utf-8', 'replace')}")
+                return None
+            os.replace(converted, pdf_path)
         return pdf_path
-    else:
-        logging.error("PDF file was not created.")
+    except subprocess.TimeoutExpired:
+        logging.error(f"PDF conversion of {pptx_path} timed out after {Config.CONVERSION_TIMEOUT} seconds.")
         return None
+    finally:
+        _profiles.put(profile)
@@ -0,0 +1,169 @@
+import os
+import zipfile
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from config import Config
+from cache import get_cache, hash_bytes, hash_json
+from pptx_extract import slide_parts, read_rels
+
+CORE_NS = {
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcterms': 'http://purl.org/dc/terms/',
+}
+
+def analysis_settings():
+    """settings that change what the ocr and vision stages make of an unchanged slide"""
+    return {
+        "native": Config.PPTX_NATIVE_EXTRACTION,
+        "density": Config.PDF_CONVERSION_DENSITY,
+        "tesseract": Config.TESSERACT_LANG,
+        "layout_ocr": Config.LAYOUT_OCR,
+    }
+
+def slide_fingerprints(pptx_path):
+    """one content hash per visible slide, in presentation order, or None when the file can't be read as a pptx.
+
+    a slide's hash covers its xml and every part it references (pictures, charts, notes,
+    its layout), and the layout's master, so an edit to any of them only changes the
+    fingerprints of the slides that show it.
+    """
+    try:
+        with zipfile.ZipFile(pptx_path) as package:
+            names = set(package.namelist())
+            part_hashes = {}
+
+            def part_hash(part):
+                if part not in part_hashes:
+                    part_hashes[part] = hash_bytes(package.read(part)) if part in names else ''
+                return part_hashes[part]
+
+            fingerprints = []
+            for part, rels in slide_parts(package):
+                related = []
+                for rel_id, (kind, target) in sorted(rels.items()):
+                    # external targets (hyperlinks, linked media) aren't in the package, their address is enough
+                    related.append([rel_id, kind, part_hash(target) if target in names else target])
+                    if kind == 'slideLayout':
+                        related.extend([kind, master_kind, part_hash(master)] for master_kind, master in read_rels(package, target).values()
+                                       if master_kind == 'slideMaster')
+                fingerprints.append(hash_json({"slide": part_hash(part), "related": related}))
+            return fingerprints
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError, ValueError) as e:
+        logging.error(f"failed to fingerprint the slides of {pptx_path}: {e}")
+        return None
+
+def deck_identity(pptx_path):
+    """who created the deck and when, from its core properties ({} when it has none).
+
+    both survive edits and re-saves, so an edited deck keeps its history while an unrelated
+    deck that only shares its file name gets one of its own.
+    """
+    try:
+        with zipfile.ZipFile(pptx_path) as package:
+            root = ET.fromstring(package.read('docProps/core.xml'))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError):
+        return {}
+    return {name: (root.findtext(f'{prefix}:{name}', default='', namespaces=CORE_NS) or '').strip()
+            for prefix, name in (('dc', 'creator'), ('dcterms', 'created'))}
+
+class DeckHistory:
+    """what was made from a deck's slides on its previous upload.
+
+    a deck is identified by its file name and its creator and creation time (deck_identity),
+    so decks that only share a name, e.g. two people's slides.pptx, never see each other's
+    fingerprints or scripts. slide records (text plus image analysis) are
+    stored by slide fingerprint in the 'slides' cache, so unchanged slides skip conversion,
+    ocr and vision; the deck's manifest in the 'decks' cache keeps the previous upload's
+    fingerprints and llm batches, so a batch whose slides are all unchanged reuses its
+    scripts instead of being generated again.
+    """
+    def __init__(self, pptx_path):
+        self.name = os.path.basename(pptx_path)
+        self.identity = deck_identity(pptx_path)
+        self.slides_cache = get_cache('slides')
+        self.decks_cache = get_cache('decks')
+        self.fingerprints = slide_fingerprints(pptx_path) if self.slides_cache and self.decks_cache else None
+        self.previous = self.decks_cache.get_json(self.key) if self.active else None
+        self.batches = []
+        self.reused_slides = set()
+        self.regenerated_batches = []
+        self.reused_batches = []
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.fingerprints is not None
+
+    @property
+    def key(self):
+        return hash_json({"deck": self.name, "identity": self.identity})
+
+    def fingerprint(self, slide_number):
+        if self.active and 0 < slide_number <= len(self.fingerprints):
+            return self.fingerprints[slide_number - 1]
+        return None
+
+    def slide_key(self, slide_number):
+        return hash_json({"fingerprint": self.fingerprint(slide_number), "settings": analysis_settings()})
+
+    def changed_slides(self):
+        """slide numbers whose content wasn't in the previous upload (every slide of a new deck)"""
+        if not self.active:
+            return []
+        known = set(self.previous["fingerprints"]) if self.previous else set()
+        return [idx + 1 for idx, fingerprint in enumerate(self.fingerprints) if fingerprint not in known]
+
+    def reusable_slides(self):
+        """{slide number: analysed slide record} for the slides that were analysed before, marked as reused"""
+        if not self.active:
+            return {}
+        reused = {}
+        for idx in range(len(self.fingerprints)):
+            record = self.slides_cache.get_json(self.slide_key(idx + 1))
+            if record is not None:
+                reused[idx + 1] = {**record, "slide_number": idx + 1, "reused": True}
+        self.reused_slides = set(reused)
+        return reused
+
+    def remember_slide(self, slide):
+        """stores an analysed slide record under its fingerprint"""
+        if self.fingerprint(slide["slide_number"]) is None:
+            return
+        self.slides_cache.put_json(self.slide_key(slide["slide_number"]), slide)
+
+    def previous_scripts(self, slide_numbers):
+        """the scripts of a previous batch with exactly these slides, unchanged and at the same positions, or None"""
+        if not self.active or not self.previous:
+            return None
+        fingerprints = [self.fingerprint(number) for number in slide_numbers]
+        for batch in self.previous["batches"]:
+            if batch["slide_numbers"] == slide_numbers and batch["fingerprints"] == fingerprints:
+                return batch["scripts"]
+        return None
+
+    def record_batch(self, slide_numbers, scripts, reused=False):
+        """keeps a complete batch's scripts for the next upload"""
+        if not self.active:
+            return
+        with self._lock:
+            self.batches.append({"slide_numbers": slide_numbers, "fingerprints": [self.fingerprint(number) for number in slide_numbers], "scripts": scripts})
+            (self.reused_batches if reused else self.regenerated_batches).append(slide_numbers)
+
+    def save(self):
+        """makes this upload the one the next upload of the deck is compared with"""
+        if self.active:
+            self.decks_cache.put_json(self.key, {"fingerprints": self.fingerprints, "batches": self.batches})
+
+    def report(self):
+        if not self.active:
+            return None
+        known = set(self.fingerprints)
+        return {
+            "previous_upload": self.previous is not None,
+            "changed_slides": self.changed_slides(),
+            "removed_slides": len([fingerprint for fingerprint in self.previous["fingerprints"] if fingerprint not in known]) if self.previous else 0,
+            "reprocessed_slides": [idx + 1 for idx in range(len(self.fingerprints)) if idx + 1 not in self.reused_slides],
+            "regenerated_batches": self.regenerated_batches,
+            "reused_batches": self.reused_batches,
+        }
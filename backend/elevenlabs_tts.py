@@ -1,26 +1,42 @@
 import os
+import threading
 from elevenlabs.client import ElevenLabs
 from langchain_community.tools.eleven_labs.text2speech import ElevenLabsText2SpeechTool
+from config import Config
+from tts_cache import synthesize_to_file
+from metrics import timed
 
-def text_to_speech(nvidia_response_json, output_path):
-    # ensure the environment variable for Eleven Labs API key is set
-    if "ELEVEN_API_KEY" not in os.environ:
-        os.environ["ELEVEN_API_KEY"] = "your_elevenlabs_api_key"
+_client = None
+_client_lock = threading.Lock()
 
+def get_client():
+    """returns the process-wide ElevenLabs client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # ensure the environment variable for Eleven Labs API key is set
+            if "ELEVEN_API_KEY" not in os.environ:
+                os.environ["ELEVEN_API_KEY"] = "your_elevenlabs_api_key"
+            _client = ElevenLabs(api_key=os.environ["ELEVEN_API_KEY"])
+        return _client
+
+def voice_params():
+    return {"voice_id": Config.ELEVENLABS_VOICE_ID, "model": Config.ELEVENLABS_MODEL}
+
+@timed("tts_synthesize", engine="elevenlabs")
+def synthesize(text):
+    """synthesizes text with elevenlabs and returns the audio bytes"""
+    audio_stream = get_client().generate(text=text, voice=Config.ELEVENLABS_VOICE_ID, model=Config.ELEVENLABS_MODEL, stream=True)
+    return b"".join(audio_stream)
+
+@timed("text_to_speech", engine="elevenlabs")
+def text_to_speech(nvidia_response_json, output_path, synthesize=synthesize):
     # extract text content from the JSON response
     text = "\n".join([slide["presentation_text"] for slide in nvidia_response_json if "presentation_text" in slide])
 
-    # Initialize Eleven Labs client
-    client = ElevenLabs(api_key=os.environ["ELEVEN_API_KEY"])
-
     # generate speech
     try:
-        audio_stream = client.generate(text=text, voice="voice_id_you_want_to_use", model="eleven_multilingual_v2", stream=True)
-        
-        # save the generated audio to the specified path
-        with open(output_path, "wb") as out:
-            for chunk in audio_stream:
-                out.write(chunk)
+        synthesize_to_file("elevenlabs", text, voice_params(), synthesize, output_path)
         print(f'audio content written to file {output_path}')
     except AttributeError as e:
         print(f"error: {e}")
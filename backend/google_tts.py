@@ -1,35 +1,58 @@
 import os
+import threading
 from google.cloud import texttospeech
 from config import Config
-
-def text_to_speech(nvidia_response_json, output_path):
-    # ensure the environment variable for google credentials is set
-    if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ:
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = Config.GOOGLE_APPLICATION_CREDENTIALS
-
-    client = texttospeech.TextToSpeechClient()
-
-    # extract text content from the json response
-    text = "\n".join([slide["presentation_text"] for slide in nvidia_response_json if "presentation_text" in slide])
-
+from tts_cache import synthesize_to_file
+from metrics import timed
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """returns the process-wide TextToSpeechClient, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # ensure the environment variable for google credentials is set
+            if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ:
+                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = Config.GOOGLE_APPLICATION_CREDENTIALS
+            _client = texttospeech.TextToSpeechClient()
+        return _client
+
+def voice_params():
+    return {
+        "language": Config.GOOGLE_TTS_LANGUAGE_CODE,
+        "voice_name": Config.GOOGLE_TTS_VOICE_NAME,
+        "ssml_gender": Config.GOOGLE_TTS_SSML_GENDER,
+        "encoding": Config.GOOGLE_TTS_AUDIO_ENCODING,
+    }
+
+@timed("tts_synthesize", engine="google")
+def synthesize(text):
+    """synthesizes text with google tts and returns the encoded audio bytes"""
     synthesis_input = texttospeech.SynthesisInput(text=text)
 
     # use wavenet female voice for higher quality
     voice = texttospeech.VoiceSelectionParams(
         language_code=Config.GOOGLE_TTS_LANGUAGE_CODE,
         name=Config.GOOGLE_TTS_VOICE_NAME,
-        ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
+        ssml_gender=texttospeech.SsmlVoiceGender[Config.GOOGLE_TTS_SSML_GENDER]
     )
 
     # set the audio encoding to linear16 for .wav format
     audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.LINEAR16
+        audio_encoding=texttospeech.AudioEncoding[Config.GOOGLE_TTS_AUDIO_ENCODING]
     )
 
-    response = client.synthesize_speech(
+    response = get_client().synthesize_speech(
         input=synthesis_input, voice=voice, audio_config=audio_config
     )
+    return response.audio_content
+
+@timed("text_to_speech", engine="google")
+def text_to_speech(nvidia_response_json, output_path, synthesize=synthesize):
+    # extract text content from the json response
+    text = "\n".join([slide["presentation_text"] for slide in nvidia_response_json if "presentation_text" in slide])
 
-    with open(output_path, "wb") as out:
-        out.write(response.audio_content)
-        print(f'audio content written to file {output_path}')
+    synthesize_to_file("google", text, voice_params(), synthesize, output_path)
+    print(f'audio content written to file {output_path}')
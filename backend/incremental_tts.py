@@ -0,0 +1,89 @@
+import io
+import re
+import time
+import threading
+import soundfile
+import numpy as np
+from config import Config
+from tts_cache import synthesize_bytes
+
+SENTENCE = re.compile(r'.+?(?:[.!?]+["\')\]]*(?=\s|$)|$)', re.S)
+CLAUSE_END = re.compile(r'(?<=[,;:])\s+')
+
+def split_sentences(text, max_chars=Config.TTS_SENTENCE_MAX_CHARS):
+    """splits a script into sentences, breaking sentences longer than max_chars at clause boundaries"""
+    pieces = []
+    for sentence in SENTENCE.findall(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        # merge clauses back together up to max_chars so the pieces don't get too short
+        current = ""
+        for clause in CLAUSE_END.split(sentence):
+            if current and len(current) + len(clause) + 1 > max_chars:
+                pieces.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            pieces.append(current)
+    return pieces
+
+def decode_audio(audio):
+    """decodes encoded audio bytes to mono float32 pcm, returns (samples, samplerate)"""
+    data, samplerate = soundfile.read(io.BytesIO(audio), dtype='float32', always_2d=True)
+    return np.mean(data, axis=1, dtype=np.float32) if data.shape[1] > 1 else data[:, 0], samplerate
+
+class IncrementalSpeech:
+    """synthesizes a script sentence by sentence and exposes the pcm of each piece in order.
+
+    all pieces are submitted to the executor on construction, so a slide queued ahead of
+    playback is synthesized in the background, and the first chunk is available after
+    one sentence rather than the whole script.
+    """
+    def __init__(self, text, engine, voice_params, synthesize, executor, limiter=None, on_complete=None):
+        self.engine = engine
+        self.voice_params = voice_params
+        self.synthesize = synthesize
+        self.limiter = limiter
+        self.on_complete = on_complete
+        self.started = time.time()
+        self.sentences = split_sentences(text)
+        self._remaining = len(self.sentences)
+        self._lock = threading.Lock()
+        self.futures = [executor.submit(self._synthesize, sentence) for sentence in self.sentences]
+        if not self.futures and on_complete:
+            on_complete(self.started, time.time())
+        for future in self.futures:
+            future.add_done_callback(self._piece_done)
+
+    def _piece_done(self, future):
+        # on_complete(start, end) fires once every piece has finished, successfully or not
+        with self._lock:
+            self._remaining -= 1
+            finished = self._remaining == 0
+        if finished and self.on_complete:
+            self.on_complete(self.started, time.time())
+
+    def _synthesize(self, sentence):
+        if self.limiter:
+            self.limiter.acquire()
+        audio, _ = synthesize_bytes(self.engine, sentence, self.voice_params, self.synthesize)
+        return decode_audio(audio)
+
+    @property
+    def samplerate(self):
+        """samplerate of the synthesized audio, blocks until the first piece is ready"""
+        return self.futures[0].result()[1] if self.futures else Config.TTS_DEFAULT_SAMPLERATE
+
+    def chunks(self):
+        for future in self.futures:
+            samples, _ = future.result()
+            yield samples
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
@@ -0,0 +1,133 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+class Job:
+    """one uploaded presentation and its own processing state"""
+    def __init__(self, file_path, output_folder, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.file_path = file_path
+        self.output_folder = output_folder
+        self.state = {
+            "is_processing": False,
+            "should_continue": True,
+            "current_slide": 0
+        }
+        self.status = "queued"  # queued, running, completed, stopped, failed or cancelled
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        # progress events from the pipeline (see progress.py), streamed to clients by /jobs/<id>/events
+        self.events = []
+        self.events_changed = threading.Condition()
+        self.state["emit"] = self.emit
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "stopped", "failed", "cancelled")
+
+    def emit(self, event):
+        with self.events_changed:
+            self.events.append({"id": len(self.events), "job_id": self.id, **event})
+            self.events_changed.notify_all()
+
+    def wait_for_events(self, since, timeout):
+        """returns the events after index since, waiting up to timeout seconds for new ones"""
+        with self.events_changed:
+            self.events_changed.wait_for(lambda: len(self.events) > since, timeout)
+            return self.events[since:]
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "current_slide": self.state["current_slide"],
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """runs presentation jobs on a bounded worker pool.
+
+    run(file_path, output_folder, state) is the pipeline entry point (main.orchestrate_process).
+    at most max_workers jobs run at once, the rest wait in the pool's queue. finished jobs are
+    kept for status queries until more than max_history jobs exist.
+    """
+    def __init__(self, run, max_workers=Config.JOB_MAX_WORKERS, max_history=Config.JOB_HISTORY):
+        self.run = run
+        self.max_history = max_history
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        job.future = self.executor.submit(self._run, job)
+        logging.info(f"queued job {job.id} for {job.file_path}")
+        return job
+
+    def _run(self, job):
+        if not job.state["should_continue"]:
+            # cancelled after the worker picked the job up, too late for future.cancel()
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.emit({"type": "done", "status": job.status, "end": job.finished_at})
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        job.state["is_processing"] = True
+        job.emit({"type": "status", "status": job.status, "start": job.started_at})
+        try:
+            job.result = self.run(job.file_path, job.output_folder, job.state)
+            if "error" in job.result:
+                job.status = "failed"
+            else:
+                job.status = job.result.get("status", "completed")
+        except Exception as e:
+            logging.error(f"job {job.id} failed: {e}")
+            job.result = {"error": str(e)}
+            job.status = "failed"
+        finally:
+            job.state["is_processing"] = False
+            job.finished_at = time.time()
+            job.emit({"type": "done", "status": job.status, "start": job.started_at, "end": job.finished_at, "duration": job.finished_at - job.started_at})
+
+    def _prune(self):
+        # forget the oldest finished jobs once the history is full
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """asks a job to stop; a job that hasn't started yet is cancelled right away. returns the job or None"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.state["should_continue"] = False
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.emit({"type": "done", "status": job.status, "end": job.finished_at})
+        return job
+
+    def cancel_all(self):
+        for job in self.list():
+            if not job.finished:
+                self.cancel(job.id)
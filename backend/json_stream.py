@@ -0,0 +1,96 @@
+import json
+import logging
+
+class IncrementalJSONArrayParser:
+    """incrementally parses a streamed top-level json array, returning each element object as soon as it closes.
+
+    anything before the opening '[' (e.g. prose or a markdown fence) is skipped, as is any
+    array without objects (e.g. "[2]" in a preamble); everything after the closing ']' of
+    the first array of objects is ignored. strings are tracked so brackets inside
+    presentation text don't affect nesting.
+    """
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.current = None  # characters of the element object being collected
+        self.count = 0
+
+    def feed(self, text):
+        """consumes the next piece of text and returns the list of objects completed by it"""
+        objects = []
+        for ch in text:
+            if self.finished:
+                break
+            if not self.started:
+                if ch == '[':
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self.current is not None:
+                self.current.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+                if self.depth == 2 and ch == '{':
+                    self.current = [ch]
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.current is not None:
+                    obj = self._decode(''.join(self.current))
+                    if obj is not None:
+                        objects.append(obj)
+                    self.current = None
+                    self.count += 1
+                elif self.depth == 0:
+                    # an array that held no objects isn't the answer, keep looking
+                    self.finished = self.count > 0
+                    self.started = self.finished
+        return objects
+
+    def _decode(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            logging.warning(f"skipping malformed object in streamed json array: {e}")
+            return None
+
+def extract_json_array(text):
+    """recovers the element objects of a json array from noisy llm output.
+
+    handles prose or markdown fences around the array and truncated output (every object
+    that closed before the cut is kept). if no array with objects is found, falls back to
+    any standalone json objects in the text.
+    """
+    if not isinstance(text, str):
+        return []
+    objects = IncrementalJSONArrayParser().feed(text)
+    if objects:
+        return objects
+
+    decoder = json.JSONDecoder()
+    idx = text.find('{')
+    while idx >= 0:
+        try:
+            obj, end = decoder.raw_decode(text, idx)
+        except json.JSONDecodeError:
+            idx = text.find('{', idx + 1)
+            continue
+        if isinstance(obj, dict):
+            objects.append(obj)
+        idx = text.find('{', end)
+    return objects
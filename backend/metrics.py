@@ -0,0 +1,160 @@
+import time
+import bisect
+import functools
+import threading
+from config import Config
+
+ENABLED = Config.METRICS_ENABLED
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """monotonically increasing value per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, key, value
+
+class Histogram:
+    """cumulative bucket counts, sum and count of observed values per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=Config.METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', key + (('le', _format_value(float(bound))),), cumulative
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, count
+
+class MetricsRegistry:
+    """process-wide collection of counters and histograms, rendered in the prometheus text format"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help='', **kwargs):
+        return self._get(Histogram, name, help, **kwargs)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram('clara_stage_seconds', 'wall time of instrumented pipeline functions')
+STAGE_ERRORS = metrics.counter('clara_stage_errors_total', 'instrumented pipeline calls that raised')
+
+def observe(stage, seconds, **labels):
+    """records a duration measured elsewhere, e.g. ocr timed inside a worker process"""
+    if ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+def count(name, amount=1, help='', **labels):
+    if ENABLED:
+        metrics.counter(name, help).inc(amount, **labels)
+
+class timed:
+    """times a block or a function into clara_stage_seconds{stage=...}.
+
+    use as `with timed("convert_to_pdf"):` or as a `@timed("convert_to_pdf")` decorator; extra
+    keyword arguments become labels. exceptions are counted in clara_stage_errors_total and
+    re-raised. with Config.METRICS_ENABLED off the decorator returns the function unchanged
+    and the context manager does nothing.
+    """
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is None:
+            return False
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage, **self.labels)
+        return False
+
+    def __call__(self, func):
+        if not ENABLED:
+            return func
+        stage, labels = self.stage, self.labels
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+def render():
+    return metrics.render()
@@ -0,0 +1,112 @@
+import time
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from config import Config
+from metrics import observe
+
+def select_torch_device(preferred=Config.VISION_DEVICE):
+    """returns the preferred torch device, falling back to cpu when cuda is unavailable"""
+    if not preferred.startswith('cuda'):
+        return preferred
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return preferred
+    except ImportError:
+        pass
+    logging.warning(f"device {preferred} is not available, falling back to cpu.")
+    return 'cpu'
+
+def paddle_gpu_available():
+    try:
+        import paddle
+        return paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0
+    except Exception:
+        return False
+
+class ModelRegistry:
+    """lazily constructs each model once per process and records load/inference timings.
+
+    loaders are registered by name and only called the first time a model is requested,
+    so importing a module that registers models stays cheap. options passed to get() are
+    forwarded to the loader and become part of the cache key.
+    """
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._inference_locks = {}
+        self.load_seconds = {}
+        self.inference_count = {}
+        self.inference_seconds = {}
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+
+    def get(self, name, **options):
+        loader = self._loaders[name]
+        # bind defaults so get('layout') and get('layout', use_gpu=<default>) share one model
+        bound = inspect.signature(loader).bind(**options)
+        bound.apply_defaults()
+        key = (name, tuple(sorted(bound.arguments.items())))
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._models:
+                start = time.perf_counter()
+                self._models[key] = loader(**options)
+                elapsed = time.perf_counter() - start
+                self.load_seconds[name] = self.load_seconds.get(name, 0.0) + elapsed
+                logging.info(f"loaded model {name} {dict(options)} in {elapsed:.2f}s")
+            return self._models[key]
+
+    def is_loaded(self, name):
+        return any(key[0] == name for key in self._models)
+
+    def warm_up(self, names=None):
+        """loads the given (default: all registered) models ahead of the first request"""
+        for name in names or list(self._loaders):
+            self.get(name)
+
+    @contextmanager
+    def timed(self, name, exclusive=True):
+        """records the wall time of one inference call for a model.
+
+        with exclusive=True calls on the same model are serialized, since the shared yolo and
+        paddle instances are not safe to run from several jobs' threads at once.
+        """
+        with self._lock:
+            inference_lock = self._inference_locks.setdefault(name, threading.Lock()) if exclusive else None
+        if inference_lock:
+            inference_lock.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if inference_lock:
+                inference_lock.release()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.inference_count[name] = self.inference_count.get(name, 0) + 1
+                self.inference_seconds[name] = self.inference_seconds.get(name, 0.0) + elapsed
+            observe("model_inference", elapsed, model=name)
+
+    def metrics(self):
+        return {
+            name: {
+                "loaded": self.is_loaded(name),
+                "load_seconds": self.load_seconds.get(name, 0.0),
+                "inference_count": self.inference_count.get(name, 0),
+                "inference_seconds": self.inference_seconds.get(name, 0.0),
+            }
+            for name in {**self._loaders, **self.inference_count}
+        }
+
+# process-wide registry shared by the vision modules
+registry = ModelRegistry()
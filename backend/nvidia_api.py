@@ -1,25 +1,26 @@
 import os
-import json
+import re
+import time
+import random
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
 from langchain_nvidia_ai_endpoints import ChatNVIDIA
+from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
 import logging
+from config import Config
+from cache import get_cache, hash_json
+from json_stream import IncrementalJSONArrayParser, extract_json_array
+from batching import serialize_slides
+from metrics import timed, count, observe
 
 # load NVIDIA API key from environment variables
 load_dotenv()
 NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
 
-def initialize_nvidia_api():
-    if not NVIDIA_API_KEY or not NVIDIA_API_KEY.startswith("nvapi-"):
-        raise ValueError("Invalid or missing NVIDIA API key")
-
-    llm = ChatNVIDIA(model="mistralai/mixtral-8x22b-instruct-v0.1", api_key=NVIDIA_API_KEY)
-    return llm
-
-def process_with_nvidia_api(combined_analysis, max_tokens=40536):
-    try:
-        llm = initialize_nvidia_api()
-
-        instructions = """
+INSTRUCTIONS = """
         You are an AI presenter. IF YOUR INPUT DOES NOT INCLUDE `"slide_number": 1,`, you are continuing a presentation that you've already started, so speak as if you are continuing a presentation.
         Remember, YOU ARE THE PRESENTER. These are YOUR slides. YOU wrote these slides, and YOU are presenting them with your text output.
         Each slide entry will have a slide number, text content extracted via OCR, and additional image analysis data from object detection.
@@ -31,93 +32,23 @@ def process_with_nvidia_api(combined_analysis, max_tokens=40536):
         Be verbose and detailed in your explanations.
         Your output for presentation_text and slide_number MUST correspond 1:1 with the slide_number from your input. YOU MUST NOT create more slides than there are in the source input.
         Your output should be in JSON format, with each slide's content under a corresponding slide number.
-        Example input:
-
-        The input JSON will have data from three models: OCR (optical character recognition), object detection, and layout analysis. The 'bbox' fields represent bounding boxes for detected elements, given as [x1, y1, x2, y2] coordinates, indicating the region of the slide where each element is located.
+        The input JSON has one entry per slide. 'text' is the slide's text in reading order, each block tagged with the kind of region it came from ([title], [text], [list], [table], [figure], [ocr] for text found outside those regions, [speaker notes] for the presenter's notes). 'objects', when present, lists what object detection found on the slide, with a confidence and a bounding box 'bbox' given as [x1, y1, x2, y2] pixel coordinates indicating where on the slide the object is.
         Example input:
         [
             {
                 "slide_number": 1,
-                "ocr_text": "Database Concepts\n\nNinth Edition\n\nChapter 6\n\nDatabase Administration\n\nDavid M. Kroenke\nScott L. Vandenberg\nRobert C. Yoder\n\n@ Pearson Copyright 2020, 2017, 2015 Pearson Education, Inc. All Rights Reserved",
-                "image_analysis": {
-                    "object_detection_model_description": "Detected 1 objects.",
-                    "object_detection_tags": [
-                        "person"
-                    ],
-                    "object_detection_objects": [
-                        {
-                            "name": "person",
-                            "confidence": 0.9626411199569702,
-                            "bbox": [
-                                215.86947631835938,
-                                155.97494506835938,
-                                873.6431274414062,
-                                705.0689086914062
-                            ]
-                        }
-                    ],
-                    "layout_analysis_results": [
-                        {
-                            "type": "title",
-                            "bbox": [50, 50, 700, 100],
-                            "text": [
-                                {
-                                    "text": "Database Concepts",
-                                    "confidence": 0.98,
-                                    "text_region": [
-                                        [50, 50],
-                                        [700, 50],
-                                        [700, 100],
-                                        [50, 100]
-                                    ]
-                                }
-                            ]
-                        },
-                        {
-                            "type": "text",
-                            "bbox": [50, 150, 700, 250],
-                            "text": [
-                                {
-                                    "text": "Ninth Edition",
-                                    "confidence": 0.95,
-                                    "text_region": [
-                                        [50, 150],
-                                        [700, 150],
-                                        [700, 200],
-                                        [50, 200]
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
-                }
+                "text": "[title] Database Concepts\n\n[text] Ninth Edition\nChapter 6\nDatabase Administration\n\n[ocr] David M. Kroenke\nScott L. Vandenberg\nRobert C. Yoder\n@ Pearson Copyright 2020, 2017, 2015 Pearson Education, Inc. All Rights Reserved",
+                "objects": [
+                    {
+                        "name": "person",
+                        "confidence": 0.96,
+                        "bbox": [220, 160, 870, 710]
+                    }
+                ]
             },
             {
                 "slide_number": 2,
-                "ocr_text": "Learning Objectives (1 of 2)\n\nUnderstand the need for and importance of database administration\nKnow basic administrative and managerial DBA functions\nUnderstand the need for concurrency control, security, and backup and recovery\nLearn about typical problems that can occur when multiple users process a database concurrently\nUnderstand the use of locking and the problem of deadlock\nLearn the difference between optimistic and pessimistic locking\nKnow the meaning of ACID transaction\nLearn the four 1992 ANSI standard isolation levels\nLearn different ways of processing a database using cursors.",
-                "image_analysis": {
-                    "object_detection_model_description": "Detected 0 objects.",
-                    "object_detection_tags": [],
-                    "object_detection_objects": [],
-                    "layout_analysis_results": [
-                        {
-                            "type": "text",
-                            "bbox": [50, 150, 700, 800],
-                            "text": [
-                                {
-                                    "text": "Understand the need for and importance of database administration",
-                                    "confidence": 0.98,
-                                    "text_region": [
-                                        [50, 150],
-                                        [700, 150],
-                                        [700, 200],
-                                        [50, 200]
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
-                }
+                "text": "[title] Learning Objectives (1 of 2)\n\n[list] Understand the need for and importance of database administration\nKnow basic administrative and managerial DBA functions\nUnderstand the need for concurrency control, security, and backup and recovery\nLearn about typical problems that can occur when multiple users process a database concurrently\nUnderstand the use of locking and the problem of deadlock\nLearn the difference between optimistic and pessimistic locking\nKnow the meaning of ACID transaction\nLearn the four 1992 ANSI standard isolation levels\nLearn different ways of processing a database using cursors."
             }
         ]
         
@@ -134,14 +65,279 @@ def process_with_nvidia_api(combined_analysis, max_tokens=40536):
         ]
         """
 
-        prompt = instructions + "\nInput:\n" + json.dumps(combined_analysis, indent=4)
-        print("mixtral prompt:", prompt[:10000], "<...>")
-        logging.debug("sending the following prompt to NVIDIA API: {}".format(prompt[:500]))
-        result = llm.invoke(prompt, temperature=0.7, top_p=0.9, max_tokens=max_tokens)
+def initialize_nvidia_api(base_url=Config.NVIDIA_BASE_URL):
+    # a local OpenAI-compatible endpoint (e.g. a stub server) doesn't need a real key
+    if base_url is None and (not NVIDIA_API_KEY or not NVIDIA_API_KEY.startswith("nvapi-")):
+        raise ValueError("Invalid or missing NVIDIA API key")
+
+    kwargs = {"base_url": base_url} if base_url else {}
+    llm = ChatNVIDIA(model=Config.NVIDIA_MODEL_NAME, api_key=NVIDIA_API_KEY, **kwargs)
+    return llm
+
+def build_messages(combined_analysis, context=None):
+    """the static instructions go first as a system message so the server can reuse the cached prefix"""
+    payload = "Input:\n" + serialize_slides(combined_analysis)
+    if context:
+        payload = "Slides you have already presented (for continuity, do not repeat them):\n" + context + "\n\n" + payload
+    if Config.LLM_SYSTEM_PROMPT:
+        return [SystemMessage(content=INSTRUCTIONS), HumanMessage(content=payload)]
+    return [HumanMessage(content=INSTRUCTIONS + "\n" + payload)]
+
+def llm_params(max_tokens):
+    return {"temperature": 0.7, "top_p": 0.9, "max_tokens": max_tokens}
+
+def batch_cache_key(combined_analysis, params, context=None):
+    return hash_json({"batch": combined_analysis, "context": context, "model": Config.NVIDIA_MODEL_NAME, "params": params})
+
+# the endpoint client raises plain exceptions whose message starts with the http status, e.g. "[429] Too Many Requests"
+RETRYABLE_STATUS = re.compile(r'^\[(429|5\d\d)\]')
+
+def retry_after(error):
+    """seconds to wait before retrying a failed request, or None if the error isn't retryable (429/5xx/connection errors)"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status_code", None)
+    if status is None:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return 0.0
+        match = RETRYABLE_STATUS.search(str(error))
+        status = int(match.group(1)) if match else None
+    if status is None or not (status == 429 or 500 <= status < 600):
+        return None
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+def token_usage(message):
+    """(prompt, completion) token counts reported by the server, None when unavailable"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+class NvidiaSession:
+    """long-lived LLM session: ChatNVIDIA clients sharing one pooled HTTP session, used by every batch.
+
+    the client keeps the request it is sending on itself (last_inputs), so concurrent batches
+    would send each other's payloads through one client; every thread gets a client of its own.
+    requests failing with 429/5xx or a connection error are retried up to Config.LLM_MAX_RETRIES
+    times with jittered exponential backoff (or the server's Retry-After), and every request's
+    latency, token counts and retry timing are recorded in self.requests.
+    """
+    def __init__(self, llm=None, base_url=Config.NVIDIA_BASE_URL):
+        # a given llm (e.g. a fake chat model) is shared by every thread
+        self.shared_llm = llm
+        self.base_url = base_url
+        self.requests = deque(maxlen=Config.LLM_METRICS_HISTORY)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.LLM_HTTP_POOL_SIZE)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        if llm is None:
+            # the creating thread's client, so a missing api key fails here instead of in the first batch
+            self._local.llm = self._new_client()
+
+    @property
+    def llm(self):
+        """the calling thread's client"""
+        if self.shared_llm is not None:
+            return self.shared_llm
+        if getattr(self._local, "llm", None) is None:
+            self._local.llm = self._new_client()
+        return self._local.llm
+
+    def _new_client(self):
+        llm = initialize_nvidia_api(base_url=self.base_url)
+        # ChatNVIDIA's client asks get_session_fn for a requests.Session on every call;
+        # handing every client the shared session keeps connections alive across batches
+        client = getattr(llm, "_client", None)
+        if client is not None and hasattr(client, "get_session_fn"):
+            # replacing get_session_fn skips the library's own session setup, which applies verify_ssl
+            self._http.verify = getattr(client, "verify_ssl", True)
+            client.get_session_fn = lambda: self._http
+        return llm
+
+    def _record(self, entry):
+        with self._lock:
+            self.requests.append(entry)
+        count("clara_llm_requests_total", help="requests sent to the NVIDIA API", outcome="error" if "error" in entry else "ok")
+        count("clara_llm_retries_total", entry["retries"], help="retried NVIDIA API requests")
+        for kind in ("prompt", "completion"):
+            if entry.get(f"{kind}_tokens"):
+                count("clara_llm_tokens_total", entry[f"{kind}_tokens"], help="tokens reported by the NVIDIA API", kind=kind)
+
+    def _backoff(self, attempt, error):
+        """seconds to wait before the next attempt, None when the error should not be retried"""
+        if attempt >= Config.LLM_MAX_RETRIES:
+            return None
+        server_wait = retry_after(error)
+        if server_wait is None:
+            return None
+        return max(server_wait, Config.LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def invoke(self, combined_analysis, context=None, **params):
+        """sends one batch and returns the response text"""
+        messages = build_messages(combined_analysis, context)
+        retry_wait = 0.0
+        start = time.perf_counter()
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            try:
+                result = self.llm.invoke(messages, **params)
+                break
+            except Exception as e:
+                wait = self._backoff(attempt, e)
+                if wait is None:
+                    self._record({"latency": time.perf_counter() - start, "retries": attempt, "retry_wait": retry_wait, "error": str(e)})
+                    raise
+                logging.warning(f"NVIDIA API request failed ({e}), retrying in {wait:.1f}s")
+                time.sleep(wait)
+                retry_wait += wait
+        prompt_tokens, completion_tokens = token_usage(result)
+        self._record({"latency": time.perf_counter() - start, "retries": attempt, "retry_wait": retry_wait,
+                      "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
         return result.content
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error: {e}")
-        return {"error": "invalid JSON format provided"}
+
+    def stream(self, combined_analysis, context=None, **params):
+        """streams one batch, yielding text chunks. a failed request is only retried before its first chunk"""
+        messages = build_messages(combined_analysis, context)
+        retry_wait = 0.0
+        start = time.perf_counter()
+        first_chunk = None
+        usage = (None, None)
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            try:
+                for chunk in self.llm.stream(messages, **params):
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - start
+                    reported = token_usage(chunk)
+                    if reported != (None, None):
+                        usage = reported
+                    yield chunk.content
+                break
+            except Exception as e:
+                wait = self._backoff(attempt, e) if first_chunk is None else None
+                if wait is None:
+                    self._record({"latency": time.perf_counter() - start, "first_chunk": first_chunk, "retries": attempt, "retry_wait": retry_wait, "error": str(e)})
+                    raise
+                logging.warning(f"NVIDIA API stream failed ({e}), retrying in {wait:.1f}s")
+                time.sleep(wait)
+                retry_wait += wait
+        self._record({"latency": time.perf_counter() - start, "first_chunk": first_chunk, "retries": attempt, "retry_wait": retry_wait,
+                      "prompt_tokens": usage[0], "completion_tokens": usage[1]})
+
+    def stats(self):
+        with self._lock:
+            requests_ = list(self.requests)
+        latencies = [r["latency"] for r in requests_]
+        return {
+            "requests": len(requests_),
+            "errors": sum(1 for r in requests_ if "error" in r),
+            "retries": sum(r["retries"] for r in requests_),
+            "retry_wait_seconds": sum(r["retry_wait"] for r in requests_),
+            "mean_latency_seconds": sum(latencies) / len(latencies) if latencies else None,
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in requests_),
+            "completion_tokens": sum(r.get("completion_tokens") or 0 for r in requests_),
+            "recent": requests_[-10:],
+        }
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """returns the process-wide NvidiaSession, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = NvidiaSession()
+        return _session
+
+def session_stats():
+    """stats of the shared session, without creating one"""
+    return _session.stats() if _session is not None else {"requests": 0}
+
+def valid_slide_number(script, expected_numbers):
+    """the slide number of a script object if it answers one of the requested slides with non-empty text, else None"""
+    if not isinstance(script, dict):
+        return None
+    text = script.get("presentation_text")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    try:
+        number = int(script.get("slide_number"))
+    except (TypeError, ValueError):
+        return None
+    return number if number in expected_numbers else None
+
+@timed("process_with_nvidia_api")
+def process_with_nvidia_api(combined_analysis, max_tokens=40536, session=None, context=None):
+    """sends one batch and returns the raw response text, or None if the request failed"""
+    try:
+        params = llm_params(max_tokens)
+        cache = get_cache('llm')
+        key = batch_cache_key(combined_analysis, params, context)
+        cached = cache.get_json(key) if cache else None
+        if cached is not None:
+            logging.info("using cached NVIDIA API response for batch.")
+            return cached
+
+        session = session or get_session()
+        logging.debug(f"sending batch of {len(combined_analysis)} slides to NVIDIA API")
+        content = session.invoke(combined_analysis, context=context, **params)
+        if cache and extract_json_array(content):  # only responses with usable slides are worth reusing
+            cache.put_json(key, content)
+        return content
     except Exception as e:
         logging.error(f"general error in NVIDIA API processing: {e}")
-        return {"error": str(e)}
+        return None
+
+def stream_with_nvidia_api(combined_analysis, max_tokens=40536, session=None, context=None):
+    """streaming variant of process_with_nvidia_api.
+
+    yields each {"slide_number", "presentation_text"} object as soon as it closes in the
+    streamed response, so the first slide of a batch can go to TTS while the rest are
+    still being generated. pass a session wrapping a fake chat model to test it offline.
+    """
+    params = llm_params(max_tokens)
+    cache = get_cache('llm')
+    key = batch_cache_key(combined_analysis, params, context)
+    cached = cache.get_json(key) if cache else None
+    if cached is not None:
+        logging.info("using cached NVIDIA API response for batch.")
+        yield from extract_json_array(cached)
+        return
+
+    try:
+        session = session or get_session()
+        logging.debug("streaming batch of {} slides to NVIDIA API".format(len(combined_analysis)))
+        parser = IncrementalJSONArrayParser()
+        content = []
+        yielded = []
+        # only the time spent waiting for the model, not the time the consumer holds the generator between slides
+        generating = 0.0
+        chunks = session.stream(combined_analysis, context=context, **params)
+        while True:
+            begin = time.perf_counter()
+            text = next(chunks, None)
+            generating += time.perf_counter() - begin
+            if text is None:
+                break
+            content.append(text)
+            for script in parser.feed(text):
+                yielded.append(script)
+                yield script
+        observe("stream_with_nvidia_api", generating)
+        response = "".join(content)
+        if not parser.finished:
+            # no complete array (bare objects, truncated output): recover what the whole reply holds
+            recovered = [script for script in extract_json_array(response) if script not in yielded]
+            if recovered:
+                logging.warning(f"streamed response had no complete json array, recovered {len(recovered)} more slide objects.")
+            yield from recovered
+        if cache and (parser.finished or extract_json_array(response)):
+            cache.put_json(key, response)
+    except Exception as e:
+        count("clara_stage_errors_total", help="instrumented pipeline calls that raised", stage="stream_with_nvidia_api")
+        logging.error(f"general error in NVIDIA API streaming: {e}")
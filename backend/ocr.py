@@ -3,27 +3,128 @@ import logging
 import json
 import uuid
 import subprocess
+import time
 from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError
-from PIL import Image
-import pytesseract
 from config import Config
-from utils import wait_for_file
 from convert import convert_to_pdf
+from cache import get_cache, hash_bytes
+from progress import stage_event, record_stage
+from metrics import timed, observe
+from rasterize import PageImages, render_pdf, pdfium_available
+from ocr_engine import init_worker, recognize
+from pptx_extract import extract_slides
+from payload import normalize_text
 
-def process_presentation(file_path):
-    """converts powerpoint to images and processes each image with ocr"""
+def process_presentation(file_path, state=None):
+    """converts powerpoint to images and processes each image with ocr.
+
+    the text of a .pptx is read straight from its xml (Config.PPTX_NATIVE_EXTRACTION); only
+    slides with pictures or charts are converted, rasterized and ocr'd, and a deck without
+    any is never converted at all. slides the job's DeckHistory (state["deck_history"])
+    analysed on an earlier upload come back as they were, marked "reused". returns the
+    slides and the PageImages holding the rendered slides for the vision stage.
+    """
     image_folder = os.path.join(Config.IMAGE_FOLDER, uuid.uuid4().hex)
     os.makedirs(image_folder, exist_ok=True)
-    pdf_path = convert_to_pdf(file_path, image_folder)
+    pages = PageImages(image_folder)
+
+    history = state.get("deck_history") if state else None
+    reused = history.reusable_slides() if history else {}
+    if reused:
+        logging.info(f"reusing the analysis of {len(reused)} of {len(history.fingerprints)} slides from an earlier upload.")
+        if len(reused) == len(history.fingerprints):
+            return [reused[number] for number in sorted(reused)], pages
+    changed = {idx for idx in range(len(history.fingerprints)) if idx + 1 not in reused} if reused else None
+
+    native = None
+    if Config.PPTX_NATIVE_EXTRACTION and file_path.lower().endswith('.pptx'):
+        with stage_event(state, "extraction"):
+            native = extract_slides(file_path)
+    if native is not None:
+        native = [reused.get(slide["slide_number"], slide) for slide in native]
+        raster = {slide["slide_number"] - 1 for slide in native if slide.get("needs_raster")}
+        logging.info(f"extracted {len(native)} slides from the pptx, {len(raster)} need rasterization.")
+        if not raster:
+            return native, pages
+
+    with stage_event(state, "conversion"):
+        pdf_path = convert_to_pdf(file_path, image_folder)
     
     if pdf_path:
-        convert_pdf_to_images(pdf_path, image_folder)
-        slide_data = process_images(image_folder)
-        return slide_data, image_folder
+        indexes = rasterize(pdf_path, pages, state)
+        if native is not None:
+            indexes = only_pages(indexes, raster, pages)
+        elif changed is not None:
+            indexes = only_pages(indexes, changed, pages)
+        with stage_event(state, "ocr"):
+            slide_data = process_pages(indexes, pages, state)
+        if native is not None:
+            return merge_ocr(native, slide_data or []), pages
+        if reused:
+            return sorted((slide_data or []) + list(reused.values()), key=lambda slide: slide["slide_number"]), pages
+        return slide_data, pages
+    elif native is not None:
+        # the slides that needed rendering go on without their image analysis
+        logging.error("failed to convert presentation to pdf, continuing with the extracted text only.")
+        return native, pages
     else:
         logging.error("failed to convert presentation to pdf.")
         return None, None
 
+def only_pages(indexes, wanted, pages):
+    """passes on the wanted page indexes, dropping the other rendered pages right away"""
+    for index in indexes:
+        if index in wanted:
+            yield index
+        else:
+            pages.discard(index)
+
+def merge_ocr(native, ocr_results):
+    """adds the ocr of rasterized slides to their extracted records.
+
+    the tesseract lines go to the vision stage, and text that only exists in pictures
+    (lines the xml doesn't contain) is appended to the slide's text.
+    """
+    by_number = {result["slide_number"]: result for result in ocr_results}
+    for slide in native:
+        result = by_number.get(slide["slide_number"])
+        if result is None:
+            continue
+        slide["ocr_lines"] = result.get("ocr_lines", [])
+        known = f" {normalize_text(slide['text'])} "
+        extra = [line.strip() for line in result["text"].splitlines()
+                 if normalize_text(line) and f" {normalize_text(line)} " not in known]
+        if extra:
+            slide["text"] = "\n\n".join(part for part in (slide["text"], "\n".join(extra)) if part)
+    return native
+
+def rasterize(pdf_path, pages, state=None):
+    """renders the pdf into pages, yielding each page index as soon as its image is ready"""
+    if Config.PDF_RASTERIZER == 'pdfium' and not pdfium_available():
+        logging.warning("pypdfium2 is not installed, falling back to imagemagick for rasterization.")
+    if Config.PDF_RASTERIZER == 'pdfium' and pdfium_available():
+        with stage_event(state, "rasterization"):
+            # recorded like the imagemagick path, counting only the wait for pages and not the consumer's work on them
+            rendering = 0.0
+            rendered = render_pdf(pdf_path)
+            while True:
+                begin = time.perf_counter()
+                page = next(rendered, None)
+                rendering += time.perf_counter() - begin
+                if page is None:
+                    break
+                index, data = page
+                pages.add(index, data)
+                yield index
+            observe("convert_pdf_to_images", rendering)
+        return
+
+    with stage_event(state, "rasterization"):
+        convert_pdf_to_images(pdf_path, pages.folder)
+    pages.scan()
+    yield from pages.indexes()
+
+@timed("convert_pdf_to_images")
 def convert_pdf_to_images(pdf_path, output_folder):
     images_path_pattern = os.path.join(output_folder, f"slide_%d.{Config.PDF_CONVERSION_FORMAT}")
     process = subprocess.run(['convert', '-density', Config.PDF_CONVERSION_DENSITY, pdf_path, images_path_pattern], capture_output=True)
@@ -35,23 +136,34 @@ def convert_pdf_to_images(pdf_path, output_folder):
     else:
         logging.info(f"converted {pdf_path} to images at {images_path_pattern}")
 
-def process_images(image_folder):
-    images = sorted([os.path.join(image_folder, f) for f in os.listdir(image_folder) if f.endswith(f'.{Config.PDF_CONVERSION_FORMAT}')], key=lambda x: int(x.split('_')[-1].split('.')[0]))
-    if not images:
-        logging.error("no images found for ocr processing.")
-        return None
-
-    logging.info(f"processing {len(images)} slides for ocr...")
+def process_images(image_folder, state=None):
+    """ocr for slide images already written to image_folder"""
+    pages = PageImages.from_folder(image_folder)
+    return process_pages(pages.indexes(), pages, state)
 
+def process_pages(indexes, pages, state=None):
+    """runs ocr on each page as its index arrives from indexes, returns the slides in order"""
     results = []
     max_workers = Config.OCR_MAX_WORKERS
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(perform_ocr, image, idx): idx for idx, image in enumerate(images)}
+    # each worker builds its tesseract handle once and reuses it for every slide
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        futures = {}
+        for idx in indexes:
+            image_bytes = pages.get(idx)
+            if image_bytes is not None:
+                futures[executor.submit(perform_ocr_timed, image_bytes, idx)] = idx
+        if not futures:
+            logging.error("no images found for ocr processing.")
+            return None
+
+        logging.info(f"processing {len(futures)} slides for ocr...")
         for future in as_completed(futures):
             idx = futures[future]
             try:
-                result = future.result(timeout=Config.OCR_TIMEOUT)  # 60 seconds timeout for each ocr task
+                result, start, end = future.result(timeout=Config.OCR_TIMEOUT)  # 60 seconds timeout for each ocr task
                 results.append(result)
+                record_stage(state, "ocr", start, end, slide=idx + 1)
+                observe("perform_ocr", end - start)  # the worker processes' own metrics never reach /metrics
                 logging.info(f"processed slide {idx + 1}")
             except TimeoutError:
                 logging.error(f"processing slide {idx + 1} timed out.")
@@ -62,10 +174,23 @@ def process_images(image_folder):
 
     return results
 
-def perform_ocr(image_path, slide_number):
+def perform_ocr_timed(image_bytes, slide_number):
+    """perform_ocr plus its start/end timestamps, measured inside the worker process"""
+    start = time.time()
+    result = perform_ocr(image_bytes, slide_number)
+    return result, start, time.time()
+
+def perform_ocr(image_bytes, slide_number):
+    """the only tesseract pass of a slide: its text, plus the line boxes the vision stage reuses for layout regions"""
     try:
-        text = pytesseract.image_to_string(Image.open(image_path))
-        return {"slide_number": slide_number + 1, "text": text}
+        cache = get_cache('ocr')
+        key = hash_bytes(image_bytes, b'tesseract-lines', Config.TESSERACT_LANG.encode('utf-8'))
+        result = cache.get_json(key) if cache else None
+        if result is None:
+            result = recognize(image_bytes)
+            if cache:
+                cache.put_json(key, result)
+        return {"slide_number": slide_number + 1, "text": result["text"], "ocr_lines": result["lines"]}
     except Exception as e:
         logging.error(f"error performing ocr on slide {slide_number + 1}: {e}")
-        return {"slide_number": slide_number + 1, "text": ""}
+        return {"slide_number": slide_number + 1, "text": "", "ocr_lines": []}
@@ -0,0 +1,81 @@
+import io
+import logging
+from PIL import Image
+from config import Config
+from model_registry import registry
+
+def tesserocr_available():
+    try:
+        import tesserocr  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def initialize_tesseract(lang=Config.TESSERACT_LANG):
+    """a persistent tesseract api handle, or None to fall back to the pytesseract cli wrapper"""
+    if not tesserocr_available():
+        logging.warning("tesserocr is not installed, falling back to pytesseract (one tesseract process per slide).")
+        return None
+    from tesserocr import PyTessBaseAPI
+    return PyTessBaseAPI(lang=lang)
+
+registry.register('tesseract', initialize_tesseract)
+
+def init_worker():
+    """process pool initializer: builds the worker's tesseract handle before its first slide"""
+    registry.warm_up(['tesseract'])
+
+def _lines_with_tesserocr(api, image):
+    from tesserocr import RIL, iterate_level
+    api.SetImage(image)
+    api.Recognize()
+    lines = []
+    for line in iterate_level(api.GetIterator(), RIL.TEXTLINE):
+        text = (line.GetUTF8Text(RIL.TEXTLINE) or '').strip()
+        bbox = line.BoundingBox(RIL.TEXTLINE)
+        if text and bbox:
+            lines.append({"text": text, "confidence": line.Confidence(RIL.TEXTLINE) / 100, "bbox": list(bbox)})
+    return lines
+
+def _lines_with_pytesseract(image, lang=Config.TESSERACT_LANG):
+    import pytesseract
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    grouped = {}
+    for idx, word in enumerate(data['text']):
+        if not word.strip():
+            continue
+        key = (data['block_num'][idx], data['par_num'][idx], data['line_num'][idx])
+        left, top = data['left'][idx], data['top'][idx]
+        box = [left, top, left + data['width'][idx], top + data['height'][idx]]
+        line = grouped.setdefault(key, {"words": [], "confidences": [], "bbox": box})
+        line["words"].append(word)
+        line["confidences"].append(max(float(data['conf'][idx]), 0.0))
+        line["bbox"] = [min(line["bbox"][0], box[0]), min(line["bbox"][1], box[1]), max(line["bbox"][2], box[2]), max(line["bbox"][3], box[3])]
+    return [{"text": " ".join(line["words"]), "confidence": sum(line["confidences"]) / len(line["confidences"]) / 100, "bbox": line["bbox"]}
+            for _, line in sorted(grouped.items())]
+
+def recognize(image):
+    """runs tesseract once over a slide and returns {"text", "lines"}.
+
+    image is encoded bytes or a PIL image. lines carry the text, confidence (0-1) and pixel
+    bbox of every text line, so layout regions can take their text from this pass instead
+    of recognizing it again.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    api = registry.get('tesseract')
+    # one handle per process, tesseract's api is not safe to share between threads
+    with registry.timed('tesseract'):
+        lines = _lines_with_tesserocr(api, image) if api is not None else _lines_with_pytesseract(image)
+    return {"text": "\n".join(line["text"] for line in lines), "lines": lines}
+
+def lines_in_region(lines, bbox):
+    """the recognized lines whose centre falls inside a layout region, in the shape of paddleocr's results"""
+    x1, y1, x2, y2 = bbox
+    inside = []
+    for line in lines:
+        lx1, ly1, lx2, ly2 = line["bbox"]
+        cx, cy = (lx1 + lx2) / 2, (ly1 + ly2) / 2
+        if x1 <= cx <= x2 and y1 <= cy <= y2:
+            inside.append({"text": line["text"], "confidence": line["confidence"], "text_region": line["bbox"]})
+    return inside
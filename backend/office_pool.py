@@ -0,0 +1,195 @@
+import os
+import time
+import queue
+import atexit
+import signal
+import pathlib
+import logging
+import threading
+import subprocess
+from config import Config
+from metrics import count
+
+def uno_available():
+    try:
+        import uno  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def run_with_timeout(function, timeout):
+    """runs function on a daemon thread and returns its result, raising TimeoutError if it takes longer than timeout.
+
+    uno calls block in the bridge and can't be interrupted; after a timeout the caller kills
+    the office process, which breaks the bridge and releases the thread.
+    """
+    outcome = {}
+    def target():
+        try:
+            outcome["result"] = function()
+        except Exception as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"no answer after {timeout} seconds")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+def properties(**values):
+    from com.sun.star.beans import PropertyValue
+    return tuple(PropertyValue(Name=name, Value=value) for name, value in values.items())
+
+class OfficeListener:
+    """one long-lived headless libreoffice, driven over uno through a named pipe.
+
+    each listener has a profile directory of its own, so listeners never hand documents to
+    each other. it is started on first use, health checked before every conversion and
+    restarted when it died, hung or has done Config.OFFICE_MAX_CONVERSIONS conversions.
+    """
+    def __init__(self, slot):
+        self.slot = slot
+        self.profile = os.path.join(Config.LIBREOFFICE_PROFILE_FOLDER, f'listener-{slot}')
+        self.pipe = f'clara-office-{os.getpid()}-{slot}'
+        self.process = None
+        self.desktop = None
+        self.conversions = 0
+
+    def start(self):
+        import uno
+        os.makedirs(self.profile, exist_ok=True)
+        # its own session, so stop() also reaches the soffice.bin the libreoffice wrapper starts
+        self.process = subprocess.Popen(['libreoffice', f'-env:UserInstallation={pathlib.Path(self.profile).as_uri()}', '--headless', '--invisible',
+                                         '--nologo', '--norestore', '--nodefault', '--nolockcheck',
+                                         f'--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.monotonic() + Config.OFFICE_START_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f'uno:pipe,name={self.pipe};urp;StarOffice.ComponentContext')
+                break
+            except Exception:
+                # the pipe only exists once office has finished starting
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"office listener {self.slot} did not start")
+                time.sleep(0.1)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        self.conversions = 0
+        logging.info(f"office listener {self.slot} started (pid {self.process.pid}).")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+        self.process = None
+        self.desktop = None
+
+    def healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            run_with_timeout(lambda: self.desktop.getComponents().hasElements(), Config.OFFICE_HEALTH_TIMEOUT)
+            return True
+        except Exception as e:
+            logging.warning(f"office listener {self.slot} failed its health check: {e}")
+            return False
+
+    def ensure_running(self):
+        if self.healthy():
+            return
+        if self.process is not None:
+            count("clara_office_restarts_total", help="office listener restarts", reason="unhealthy")
+            self.stop()
+        self.start()
+
+    def _convert(self, source_path, pdf_path):
+        import uno
+        document = self.desktop.loadComponentFromURL(uno.systemPathToFileUrl(os.path.abspath(source_path)), '_blank', 0,
+                                                     properties(Hidden=True, ReadOnly=True))
+        if document is None:
+            raise RuntimeError("office could not open the document")
+        try:
+            document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)), properties(FilterName='impress_pdf_Export'))
+        finally:
+            document.close(True)
+
+    def convert(self, source_path, pdf_path, timeout=Config.CONVERSION_TIMEOUT):
+        """converts one document, returns True when pdf_path was written"""
+        try:
+            run_with_timeout(lambda: self._convert(source_path, pdf_path), timeout)
+        except TimeoutError:
+            logging.error(f"office listener {self.slot} hung converting {source_path}, restarting it.")
+            count("clara_office_restarts_total", help="office listener restarts", reason="timeout")
+            self.stop()
+            return False
+        except Exception as e:
+            logging.error(f"office listener {self.slot} failed to convert {source_path}: {e}")
+            self.stop()  # the document may still be open, start clean
+            return False
+        self.conversions += 1
+        if self.conversions >= Config.OFFICE_MAX_CONVERSIONS:
+            # office grows with every document it opens, recycle it before the next one
+            count("clara_office_restarts_total", help="office listener restarts", reason="recycle")
+            self.stop()
+        return os.path.exists(pdf_path)
+
+class OfficePool:
+    """Config.OFFICE_POOL_SIZE warm office listeners, each converting one document at a time"""
+    def __init__(self, size=Config.OFFICE_POOL_SIZE):
+        self.listeners = [OfficeListener(slot) for slot in range(size)]
+        self.idle = queue.Queue()
+        for listener in self.listeners:
+            self.idle.put(listener)
+
+    def start(self):
+        """starts every listener now instead of on its first conversion"""
+        for listener in self.listeners:
+            try:
+                listener.ensure_running()
+            except Exception as e:
+                logging.error(f"failed to start office listener {listener.slot}: {e}")
+
+    def convert(self, source_path, pdf_path, timeout=Config.CONVERSION_TIMEOUT):
+        """converts on the next idle listener. raises RuntimeError when it can't be started"""
+        listener = self.idle.get()
+        try:
+            try:
+                listener.ensure_running()
+            except Exception as e:
+                raise RuntimeError(f"office listener {listener.slot} is unavailable: {e}") from e
+            return listener.convert(source_path, pdf_path, timeout)
+        finally:
+            self.idle.put(listener)
+
+    def close(self):
+        for listener in self.listeners:
+            listener.stop()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """the process's office pool, or None when it is disabled or uno is not installed"""
+    global _pool
+    if Config.OFFICE_POOL_SIZE <= 0 or not uno_available():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = OfficePool()
+            atexit.register(_pool.close)
+        return _pool
+
+def warm_up():
+    pool = get_pool()
+    if pool is None:
+        logging.warning("office pool is disabled or uno is not installed, presentations are converted by a new libreoffice process each.")
+        return
+    pool.start()
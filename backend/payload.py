@@ -0,0 +1,81 @@
+import re
+import logging
+from config import Config
+from batching import slide_tokens
+
+# compactors turn a slide record from the vision stage into the payload sent to the LLM.
+# every compactor must keep "slide_number", the prompt's 1:1 output contract depends on it
+COMPACTORS = {}
+
+def register_compactor(name):
+    def decorator(func):
+        COMPACTORS[name] = func
+        return func
+    return decorator
+
+def normalize_text(text):
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+def quantize_bbox(bbox, step=Config.LLM_PAYLOAD_BBOX_STEP):
+    return [int(round(float(v) / step) * step) for v in bbox]
+
+def region_lines(region, min_confidence):
+    """text lines of one ppstructure region, dropping low-confidence recognitions"""
+    res = region.get('text') or []
+    if isinstance(res, dict):
+        # table regions carry html instead of recognized lines
+        html = res.get('html', '')
+        rows = re.findall(r'<tr>(.*?)</tr>', html, re.S)
+        return [' | '.join(re.sub(r'<[^>]+>', '', cell).strip() for cell in re.findall(r'<td[^>]*>(.*?)</td>', row, re.S)) for row in rows]
+    return [line['text'] for line in res if isinstance(line, dict) and line.get('text') and line.get('confidence', 1.0) >= min_confidence]
+
+def reading_order(regions, row_step=Config.LLM_PAYLOAD_BBOX_STEP):
+    # top-to-bottom in coarse rows, then left-to-right, so side-by-side columns sharing a row stay in order
+    return sorted(regions, key=lambda region: (int(region['bbox'][1] // row_step), region['bbox'][0]))
+
+@register_compactor('full')
+def full_payload(slide):
+    """the slide record as-is"""
+    return slide
+
+@register_compactor('compact')
+def compact_payload(slide, min_confidence=Config.LLM_PAYLOAD_MIN_CONFIDENCE):
+    """reading-order text plus quantized object detections.
+
+    layout regions are merged into one text in reading order, tagged with their region type;
+    tesseract lines already covered by the paddleocr text are dropped; detections below
+    min_confidence are dropped and the remaining boxes are rounded to a coarse grid.
+    """
+    analysis = slide.get("image_analysis") or {}
+    sections = []
+    covered = set()
+    for region in reading_order([r for r in analysis.get("layout_analysis_results", []) if r.get('bbox')]):
+        lines = region_lines(region, min_confidence)
+        if lines:
+            sections.append(f"[{region['type']}] " + "\n".join(lines))
+            covered.update(normalize_text(line) for line in lines)
+
+    covered_text = f" {' '.join(covered)} "
+    extra_lines = [line.strip() for line in (slide.get("text") or "").splitlines()
+                   if normalize_text(line) and f" {normalize_text(line)} " not in covered_text]
+    if extra_lines:
+        sections.append(("[ocr] " if sections else "") + "\n".join(extra_lines))
+    if slide.get("speaker_notes"):
+        sections.append("[speaker notes] " + slide["speaker_notes"])
+
+    payload = {"slide_number": slide["slide_number"], "text": "\n\n".join(sections)}
+    objects = [
+        {"name": obj["name"], "confidence": round(obj["confidence"], 2), "bbox": quantize_bbox(obj["bbox"])}
+        for obj in analysis.get("object_detection_objects", []) if obj["confidence"] >= min_confidence
+    ]
+    if objects:
+        payload["objects"] = objects
+    return payload
+
+def compact_slide(slide, compactor=None):
+    """returns (payload, report) where report holds the slide's token counts before and after compaction"""
+    name = compactor or Config.LLM_PAYLOAD_COMPACTOR
+    payload = COMPACTORS[name](slide)
+    report = {"slide_number": slide["slide_number"], "compactor": name, "tokens_before": slide_tokens(slide), "tokens_after": slide_tokens(payload)}
+    logging.info(f"slide {slide['slide_number']} payload: {report['tokens_before']} -> {report['tokens_after']} tokens ({name})")
+    return payload, report
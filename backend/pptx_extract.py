@@ -0,0 +1,201 @@
+import zipfile
+import logging
+import posixpath
+import xml.etree.ElementTree as ET
+
+NS = {
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+REL_ID = f"{{{NS['r']}}}id"
+TABLE_URI = 'http://schemas.openxmlformats.org/drawingml/2006/table'
+TITLE_TYPES = {'title', 'ctrTitle'}
+# placeholders without content of their own, their text is never shown on the slide
+SKIPPED_PLACEHOLDERS = {'dt', 'ftr', 'sldNum', 'hdr'}
+
+def rels_part(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, '_rels', name + '.rels')
+
+def read_rels(package, part):
+    """{relationship id: (type, target part)} of a part, targets resolved against the part's directory"""
+    try:
+        root = ET.fromstring(package.read(rels_part(part)))
+    except KeyError:
+        return {}
+    rels = {}
+    for rel in root.findall('rel:Relationship', NS):
+        target = rel.get('Target')
+        if rel.get('TargetMode') != 'External':
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+        rels[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], target)
+    return rels
+
+def slide_parts(package):
+    """(part name, rels) of every visible slide, in presentation order.
+
+    hidden slides are left out, like in libreoffice's pdf export, so slide numbers match the
+    rendered pages.
+    """
+    presentation = 'ppt/presentation.xml'
+    rels = read_rels(package, presentation)
+    root = ET.fromstring(package.read(presentation))
+    parts = []
+    for slide_id in root.findall('p:sldIdLst/p:sldId', NS):
+        _, part = rels[slide_id.get(REL_ID)]
+        if ET.fromstring(package.read(part)).get('show') == '0':
+            continue
+        parts.append((part, read_rels(package, part)))
+    return parts
+
+def paragraph_text(paragraph):
+    pieces = []
+    for node in paragraph:
+        if node.tag in (f"{{{NS['a']}}}r", f"{{{NS['a']}}}fld"):
+            pieces.append(''.join(t.text or '' for t in node.iter(f"{{{NS['a']}}}t")))
+        elif node.tag == f"{{{NS['a']}}}br":
+            pieces.append('\n')
+    return ''.join(pieces).strip()
+
+def text_body_lines(body):
+    """the paragraphs of a text body as (indent level, text)"""
+    lines = []
+    for paragraph in body.findall('a:p', NS):
+        text = paragraph_text(paragraph)
+        if text:
+            properties = paragraph.find('a:pPr', NS)
+            lines.append((int(properties.get('lvl', 0)) if properties is not None else 0, text))
+    return lines
+
+def table_rows(table):
+    rows = []
+    for row in table.findall('a:tr', NS):
+        cells = [' '.join(text for _, text in text_body_lines(cell.find('a:txBody', NS))) if cell.find('a:txBody', NS) is not None else ''
+                 for cell in row.findall('a:tc', NS)]
+        if any(cells):
+            rows.append(' | '.join(cells))
+    return rows
+
+def placeholder(shape):
+    ph = shape.find('./*/p:nvPr/p:ph', NS)
+    if ph is None:
+        return None
+    return ph.get('type', 'body'), ph.get('idx')
+
+def offset(shape):
+    off = shape.find('./p:spPr/a:xfrm/a:off', NS)
+    if off is None:
+        off = shape.find('./p:xfrm/a:off', NS)  # graphic frames
+    if off is None:
+        off = shape.find('./p:grpSpPr/a:xfrm/a:off', NS)
+    return (int(off.get('y')), int(off.get('x'))) if off is not None else None
+
+def layout_offsets(package, rels):
+    """positions of the layout's placeholders, which slide placeholders without their own xfrm inherit"""
+    layout = next((target for kind, target in rels.values() if kind == 'slideLayout'), None)
+    if layout is None:
+        return {}
+    offsets = {}
+    for shape in ET.fromstring(package.read(layout)).iter(f"{{{NS['p']}}}sp"):
+        ph, position = placeholder(shape), offset(shape)
+        if ph and position:
+            kind, idx = ph
+            if idx is not None:
+                offsets.setdefault(('idx', idx), position)
+            offsets.setdefault(('type', kind), position)
+    return offsets
+
+def block_position(block, inherited):
+    if block['offset'] is not None or block['placeholder'] is None:
+        return block['offset']
+    # slide placeholders are matched to the layout's by idx, and by type when they have none
+    kind, idx = block['placeholder']
+    return inherited.get(('idx', idx)) or inherited.get(('type', kind))
+
+def walk_shapes(tree, found):
+    """collects the text blocks of a shape tree and whether anything on it needs to be rendered"""
+    for shape in tree:
+        tag = shape.tag.rsplit('}', 1)[-1]
+        if tag == 'grpSp':
+            walk_shapes(shape, found)
+        elif tag == 'sp':
+            ph = placeholder(shape)
+            if ph and ph[0] in SKIPPED_PLACEHOLDERS:
+                continue
+            body = shape.find('p:txBody', NS)
+            lines = text_body_lines(body) if body is not None else []
+            if lines:
+                found['blocks'].append({'kind': 'title' if ph and ph[0] in TITLE_TYPES else 'text', 'lines': lines,
+                                        'placeholder': ph, 'offset': offset(shape)})
+            if shape.find('p:spPr/a:blipFill', NS) is not None:
+                found['pictures'] += 1  # shape filled with an image
+        elif tag == 'pic':
+            found['pictures'] += 1
+        elif tag == 'graphicFrame':
+            data = shape.find('a:graphic/a:graphicData', NS)
+            table = data.find('a:tbl', NS) if data is not None else None
+            if table is not None and data.get('uri') == TABLE_URI:
+                rows = table_rows(table)
+                if rows:
+                    found['blocks'].append({'kind': 'table', 'lines': [(0, row) for row in rows], 'placeholder': None, 'offset': offset(shape)})
+            else:
+                found['graphics'] += 1  # charts, smartart, embedded objects
+        elif tag in ('contentPart', 'AlternateContent'):
+            found['graphics'] += 1
+
+def notes_text(package, rels):
+    notes = next((target for kind, target in rels.values() if kind == 'notesSlide'), None)
+    if notes is None:
+        return ''
+    lines = []
+    for shape in ET.fromstring(package.read(notes)).iter(f"{{{NS['p']}}}sp"):
+        ph = placeholder(shape)
+        body = shape.find('p:txBody', NS)
+        if ph and ph[0] == 'body' and body is not None:
+            lines.extend(text for _, text in text_body_lines(body))
+    return '\n'.join(lines)
+
+def reading_order(blocks, inherited):
+    # the title first, then top-to-bottom and left-to-right; blocks without any known position keep document order
+    def key(item):
+        idx, block = item
+        position = block_position(block, inherited)
+        return (block['kind'] != 'title', position is None, position or (0, 0), idx)
+    return [block for _, block in sorted(enumerate(blocks), key=key)]
+
+def format_block(block):
+    if block['kind'] in ('title', 'table'):
+        return '\n'.join(text for _, text in block['lines'])
+    return '\n'.join(f"{'  ' * level}- {text}" for level, text in block['lines'])
+
+def extract_slide(package, part, rels, slide_number):
+    root = ET.fromstring(package.read(part))
+    found = {'blocks': [], 'pictures': 0, 'graphics': 0}
+    tree = root.find('p:cSld/p:spTree', NS)
+    if tree is not None:
+        walk_shapes(tree, found)
+    blocks = reading_order(found['blocks'], layout_offsets(package, rels))
+    titles = [block for block in blocks if block['kind'] == 'title']
+    return {
+        "slide_number": slide_number,
+        "title": format_block(titles[0]) if titles else "",
+        "text": "\n\n".join(format_block(block) for block in blocks),
+        "speaker_notes": notes_text(package, rels),
+        # pictures and charts only exist as pixels, those slides still go through rasterization, ocr and vision
+        "needs_raster": bool(found['pictures'] or found['graphics']),
+    }
+
+def extract_slides(pptx_path):
+    """reads titles, bullets (with their level), tables and speaker notes straight from the pptx xml.
+
+    returns one record per visible slide in presentation order, or None when the file
+    can't be read as a pptx (the caller then falls back to ocr).
+    """
+    try:
+        with zipfile.ZipFile(pptx_path) as package:
+            return [extract_slide(package, part, rels, idx + 1) for idx, (part, rels) in enumerate(slide_parts(package))]
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError, ValueError) as e:
+        logging.error(f"native pptx extraction failed for {pptx_path}: {e}")
+        return None
@@ -0,0 +1,36 @@
+import time
+import logging
+from contextlib import contextmanager
+
+def emit_event(state, event):
+    """hands a progress event to the job's listener (state["emit"]), if there is one"""
+    emit = state.get("emit") if state else None
+    if emit is None:
+        return
+    try:
+        emit(event)
+    except Exception as e:
+        logging.error(f"failed to emit progress event {event}: {e}")
+
+@contextmanager
+def stage_event(state, stage, **fields):
+    """emits a start event and an end event (with timestamps and duration) around one unit of pipeline work.
+
+    fields (e.g. slide=3 or slides=[1, 2]) are copied into both events. the end event carries
+    "ok": False when the block raised.
+    """
+    start = time.time()
+    emit_event(state, {"type": "start", "stage": stage, "start": start, **fields})
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        end = time.time()
+        emit_event(state, {"type": "end", "stage": stage, "start": start, "end": end, "duration": end - start, "ok": ok, **fields})
+
+def record_stage(state, stage, start, end, **fields):
+    """emits an end event for work that was timed elsewhere (e.g. in a worker process)"""
+    emit_event(state, {"type": "end", "stage": stage, "start": start, "end": end, "duration": end - start, "ok": True, **fields})
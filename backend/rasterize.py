@@ -0,0 +1,120 @@
+import io
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import Config
+from utils import atomic_write
+
+def page_path(folder, index):
+    """where the image of page index (0-based) lives on disk, named like imagemagick's slide_%d output"""
+    return os.path.join(folder, f"slide_{index}.{Config.PDF_CONVERSION_FORMAT}")
+
+class PageImages:
+    """encoded slide images keyed by 0-based page index.
+
+    pages rendered in process are kept in memory and handed to the ocr and vision stages
+    without touching the disk; with write_through they are also saved to folder, for the
+    annotated images and debugging. pages only on disk (the imagemagick fallback) are
+    read from folder on demand.
+    """
+    def __init__(self, folder, write_through=Config.RASTER_WRITE_THROUGH):
+        self.folder = folder
+        self.write_through = write_through
+        self._images = {}
+        self._on_disk = set()
+
+    @classmethod
+    def from_folder(cls, folder):
+        """pages already written to folder as slide_<n> images"""
+        pages = cls(folder, write_through=False)
+        pages.scan()
+        return pages
+
+    def scan(self):
+        suffix = f'.{Config.PDF_CONVERSION_FORMAT}'
+        for name in os.listdir(self.folder):
+            if name.startswith('slide_') and name.endswith(suffix) and name[len('slide_'):-len(suffix)].isdigit():
+                self._on_disk.add(int(name[len('slide_'):-len(suffix)]))
+
+    def add(self, index, data):
+        self._images[index] = data
+        if self.write_through:
+            atomic_write(self.path(index), data)
+            self._on_disk.add(index)
+
+    def path(self, index):
+        return page_path(self.folder, index)
+
+    def indexes(self):
+        return sorted(set(self._images) | self._on_disk)
+
+    def get(self, index):
+        """the encoded image of a page, None when it was never rendered or can't be read"""
+        data = self._images.get(index)
+        if data is not None or index not in self._on_disk:
+            return data
+        try:
+            with open(self.path(index), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            logging.error(f"failed to read page image {self.path(index)}: {e}")
+            return None
+
+    def discard(self, index):
+        """drops a page from memory once every stage has used it (a written-through copy stays on disk)"""
+        self._images.pop(index, None)
+
+    def __len__(self):
+        return len(self.indexes())
+
+def pdfium_available():
+    try:
+        import pypdfium2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+# each render worker opens the pdf once and renders many pages from it
+_document = None
+
+def _open_document(pdf_path):
+    global _document
+    import pypdfium2 as pdfium
+    _document = pdfium.PdfDocument(pdf_path)
+
+def _render_page(index, scale, image_format):
+    page = _document[index]
+    try:
+        image = page.render(scale=scale).to_pil()
+    finally:
+        page.close()
+    buffer = io.BytesIO()
+    # fast png compression, the image only lives for one run
+    image.save(buffer, format=image_format, compress_level=1)
+    return index, buffer.getvalue()
+
+def render_pdf(pdf_path, dpi=int(Config.PDF_CONVERSION_DENSITY), max_workers=Config.RASTER_MAX_WORKERS):
+    """renders every page of a pdf with pdfium on a process pool.
+
+    yields (page index, encoded image bytes) as each page finishes, in completion order,
+    so ocr can start on the first pages while the rest are still being rendered.
+    pdfium is not thread safe, hence processes rather than threads.
+    """
+    import pypdfium2 as pdfium
+    document = pdfium.PdfDocument(pdf_path)
+    try:
+        num_pages = len(document)
+    finally:
+        document.close()
+    if not num_pages:
+        return
+
+    scale = dpi / 72  # pdf user space is 72 units per inch
+    image_format = Config.PDF_CONVERSION_FORMAT.upper()
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, num_pages)), initializer=_open_document, initargs=(pdf_path,)) as executor:
+        futures = {executor.submit(_render_page, index, scale, image_format): index for index in range(num_pages)}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                logging.error(f"error rendering page {futures[future] + 1} of {pdf_path}: {e}")
@@ -0,0 +1,32 @@
+import logging
+from config import Config
+from cache import get_cache, hash_json
+from utils import atomic_write
+
+def tts_cache_key(engine, text, voice_params):
+    """content address of synthesized audio: engine, voice parameters and the exact text"""
+    return hash_json({"engine": engine, "text": text, "voice": voice_params})
+
+def synthesize_bytes(engine, text, voice_params, synthesize):
+    """returns (audio bytes, from_cache) for text, calling synthesize(text) -> bytes only on a cache miss"""
+    cache = get_cache('tts', max_bytes=Config.TTS_CACHE_MAX_BYTES)
+    key = tts_cache_key(engine, text, voice_params)
+    audio = cache.get_bytes(key) if cache else None
+    if audio is not None:
+        return audio, True
+
+    audio = synthesize(text)
+    if cache:
+        cache.put_bytes(key, audio)
+    return audio, False
+
+def synthesize_to_file(engine, text, voice_params, synthesize, output_path):
+    """writes audio for text to output_path, calling synthesize(text) -> bytes only on a cache miss.
+
+    returns True when the audio came from the cache.
+    """
+    audio, cached = synthesize_bytes(engine, text, voice_params, synthesize)
+    if cached:
+        logging.info(f"using cached {engine} audio for {output_path}")
+    atomic_write(output_path, audio)
+    return cached
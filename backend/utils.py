@@ -1,15 +1,34 @@
 import os
 import time
-import logging
+import tempfile
+import threading
 
-def wait_for_file(file_path, timeout=30):
-    """wait for a file to exist until timeout"""
-    start_time = time.time()
-    while True:
-        if os.path.exists(file_path):
-            logging.info(f"file {file_path} found, proceeding with conversion.")
-            return True
-        elif (time.time() - start_time) > timeout:
-            logging.error(f"file {file_path} not found after {timeout} seconds.")
-            return False
-        time.sleep(1)  # sleep for a second before retrying
+def atomic_write(path, data):
+    """writes data to path through a temp file next to it, so a reader never sees a partially written file"""
+    # the .tmp- prefix keeps half-written files out of the cache's size scan
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class RateLimiter:
+    """spaces out calls so that at most `rate` start per second, shared across threads (rate <= 0 disables it)"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -1,14 +1,14 @@
 import os
 import json
 import cv2
-import torch
-from ultralytics import YOLO
-import pytesseract
-from paddleocr import PPStructure, PaddleOCR
 from PIL import Image
 import logging
 import numpy as np
 from config import Config
+from model_registry import registry, select_torch_device, paddle_gpu_available
+from cache import get_cache, hash_bytes
+from metrics import timed
+from ocr_engine import recognize, lines_in_region
 
 # initialize yolo model
 model_path = 'models/yolov8x.pt'
@@ -21,24 +21,46 @@ def download_model(url, path):
     urlretrieve(url, path)
 
 def initialize_yolo():
+    from ultralytics import YOLO
     if not os.path.exists(model_path):
         logging.info("model file not found. downloading...")
         download_model(model_url, model_path)
     model = YOLO(model_path)
-    model.to('cuda')
+    model.to(select_torch_device())
     return model
 
-# initialize yolo model globally
-yolo_model = initialize_yolo()
-
 def initialize_ocr(use_gpu=Config.PADDLEOCR_USE_GPU):
+    from paddleocr import PaddleOCR
+    use_gpu = use_gpu and paddle_gpu_available()
     return PaddleOCR(use_angle_cls=Config.PADDLEOCR_USE_ANGLE_CLS, lang=Config.PADDLEOCR_LANG, use_gpu=use_gpu, use_cudnn=Config.PADDLEOCR_USE_CUDNN)
 
-def initialize_layout(use_gpu=Config.PADDLEOCR_USE_GPU):
-    return PPStructure(recovery=False, layout=True, table=True, ocr=True, use_gpu=use_gpu, use_cudnn=Config.PADDLEOCR_USE_CUDNN)
+def initialize_layout(use_gpu=Config.PADDLEOCR_USE_GPU, ocr=Config.LAYOUT_OCR):
+    from paddleocr import PPStructure
+    use_gpu = use_gpu and paddle_gpu_available()
+    return PPStructure(recovery=False, layout=True, table=True, ocr=ocr, use_gpu=use_gpu, use_cudnn=Config.PADDLEOCR_USE_CUDNN)
+
+# models are built lazily on first use and then shared for the rest of the process
+registry.register('yolo', initialize_yolo)
+registry.register('ocr', initialize_ocr)
+registry.register('layout', initialize_layout)
+
+def warm_up(names=Config.VISION_WARM_START_MODELS):
+    """loads the vision models up front so the first slide doesn't pay the load time"""
+    registry.warm_up(names)
+
+def read_image_bytes(image_path):
+    try:
+        with open(image_path, 'rb') as f:
+            return f.read()
+    except OSError as e:
+        logging.error(f"failed to read image: {image_path}: {e}")
+        return None
 
-def preprocess_image(image_path):
-    img = cv2.imread(image_path)
+def preprocess_image(image_path, image_bytes=None):
+    if image_bytes is None:
+        img = cv2.imread(image_path)
+    else:
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
     if img is None:
         logging.error(f"failed to read image: {image_path}")
         return None
@@ -48,22 +70,11 @@ def preprocess_image(image_path):
         img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
     return img
 
-def analyze_image(image_path):
-    img = preprocess_image(image_path)
-    if img is None:
-        return {}
-
-    # yolo analysis
-    yolo_results = yolo_model(img)
-
-    logging.info(f"yolo results: {yolo_results}")
-
-    # access the names directly from the model
-    class_names = yolo_model.names
-
+def summarize_detections(yolo_result, class_names, img, image_path):
+    """turns one yolo result into the object detection fields and saves an annotated copy of the slide"""
     # check for detections and log detailed information
-    if yolo_results[0].boxes is not None:
-        boxes = yolo_results[0].boxes
+    if yolo_result.boxes is not None:
+        boxes = yolo_result.boxes
         classes = boxes.cls.cpu().numpy() if boxes.cls is not None else []
         confidences = boxes.conf.cpu().numpy() if boxes.conf is not None else []
 
@@ -74,14 +85,15 @@ def analyze_image(image_path):
         objects = [{'name': class_names[int(cls)], 'confidence': float(conf), 'bbox': box.tolist()}
                    for box, cls, conf in zip(boxes.xyxy.cpu().numpy(), classes, confidences)]
 
-        # draw bounding boxes on the image
+        # draw bounding boxes on a copy, the decoded slide is shared with the ocr and layout engines
+        annotated = img.copy()
         for box in boxes.xyxy.cpu().numpy():
             x1, y1, x2, y2 = map(int, box)
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
         # save the annotated image for verification
         annotated_image_path = f"{os.path.splitext(image_path)[0]}_annotated.png"
-        cv2.imwrite(annotated_image_path, img)
+        cv2.imwrite(annotated_image_path, annotated)
         logging.info(f"saved annotated image to {annotated_image_path}")
 
     else:
@@ -94,41 +106,125 @@ def analyze_image(image_path):
         "object_detection_objects": objects,
     }
 
-def extract_text_with_tesseract(image_path):
+def analyze_image(image_path, img=None):
+    if img is None:
+        img = preprocess_image(image_path)
+    if img is None:
+        return {}
+
+    # yolo analysis
+    yolo_model = registry.get('yolo')
+    with registry.timed('yolo'):
+        yolo_results = yolo_model(img)
+
+    logging.info(f"yolo results: {yolo_results}")
+
+    # access the names directly from the model
+    return summarize_detections(yolo_results[0], yolo_model.names, img, image_path)
+
+def extract_text_with_tesseract(image_path, img=None):
+    return extract_lines_with_tesseract(image_path, img=img)["text"]
+
+def extract_lines_with_tesseract(image_path, img=None):
+    """text and line boxes from the shared tesseract engine, for slides that didn't go through the ocr stage"""
     try:
-        text = pytesseract.image_to_string(Image.open(image_path))
-        return text
+        if img is not None:
+            return recognize(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+        with open(image_path, 'rb') as f:
+            return recognize(f.read())
     except Exception as e:
         logging.error(f"error during tesseract ocr extraction: {e}")
-        return ""
+        return {"text": "", "lines": []}
+
+@timed("layout_analysis")
+def layout_analysis(image_path, use_gpu=Config.PADDLEOCR_USE_GPU, img=None, ocr_lines=None):
+    """layout regions of a slide with their text.
 
-def layout_analysis(image_path, use_gpu=Config.PADDLEOCR_USE_GPU):
-    layout = initialize_layout(use_gpu=use_gpu)
-    img = preprocess_image(image_path)
+    with Config.LAYOUT_OCR off, ppstructure only finds the regions and their text is taken
+    from the tesseract lines (ocr_lines, from the ocr stage) instead of a second recognition.
+    """
+    if img is None:
+        img = preprocess_image(image_path)
     if img is None:
         return []
     try:
-        result = layout(img)
+        layout = registry.get('layout', use_gpu=use_gpu, ocr=Config.LAYOUT_OCR)
+        with registry.timed('layout'):
+            result = layout(img)
         logging.debug(f"ppstructure result: {result}")
         layout_results = []
         for item in result:
             if 'type' in item and 'bbox' in item:
+                text = item.get('res') or []
+                if not Config.LAYOUT_OCR and not isinstance(text, dict):  # tables keep their html
+                    if ocr_lines is None:
+                        ocr_lines = extract_lines_with_tesseract(image_path, img=img)["lines"]
+                    text = lines_in_region(ocr_lines, item['bbox'])
                 layout_results.append({
                     'type': item['type'],
                     'bbox': item['bbox'],
-                    'text': item['res'] if 'res' in item else []
+                    'text': text
                 })
         return layout_results
     except Exception as e:
         logging.error(f"error during layout analysis: {e}")
         return []
 
-def get_image_analysis(image_path, use_gpu=Config.PADDLEOCR_USE_GPU):
-    analysis = analyze_image(image_path)
-    text_results = extract_text_with_tesseract(image_path)
-    layout_results = layout_analysis(image_path, use_gpu=use_gpu)
-
-    analysis["ocr_text"] = text_results
-    analysis["layout_analysis_results"] = layout_results
+def vision_cache_key(image_bytes, use_gpu):
+    """content address of a slide's vision analysis: the png bytes plus the models/params that produced it"""
+    params = json.dumps({"yolo": model_path, "layout": "ppstructure", "layout_text": "paddleocr" if Config.LAYOUT_OCR else "tesseract", "use_gpu": use_gpu}, sort_keys=True)
+    return hash_bytes(image_bytes, params.encode('utf-8'))
 
-    return analysis
+def get_image_analysis(image_path, use_gpu=Config.PADDLEOCR_USE_GPU):
+    return get_image_analysis_batch([image_path], batch_size=1, use_gpu=use_gpu)[0]
+
+def get_image_analysis_batch(image_paths, batch_size=Config.VISION_BATCH_SIZE, use_gpu=Config.PADDLEOCR_USE_GPU, images=None, ocr_lines=None):
+    """batched variant of get_image_analysis, returns one analysis per path in the same order.
+
+    each slide is read and decoded once and the same array is fed to yolo (one call per
+    batch of batch_size slides) and ppstructure. slides whose png bytes were analysed
+    before are served from the vision cache without touching any model. unreadable slides
+    get an empty analysis. images optionally gives the encoded image of each path already
+    in memory (None entries are read from disk), ocr_lines the tesseract lines of each
+    slide from the ocr stage (None entries are recognized here).
+    """
+    cache = get_cache('vision')
+    analyses = []
+    for start in range(0, len(image_paths), batch_size):
+        paths = image_paths[start:start + batch_size]
+        results = {}
+        pending = []
+        for idx, path in enumerate(paths):
+            image_bytes = images[start + idx] if images is not None else None
+            if image_bytes is None:
+                image_bytes = read_image_bytes(path)
+            if image_bytes is None:
+                results[idx] = {}
+                continue
+            key = vision_cache_key(image_bytes, use_gpu)
+            cached = cache.get_json(key) if cache else None
+            if cached is not None:
+                results[idx] = cached
+                continue
+            img = preprocess_image(path, image_bytes=image_bytes)
+            if img is None:
+                results[idx] = {}
+                continue
+            pending.append((idx, path, img, key, ocr_lines[start + idx] if ocr_lines is not None else None))
+
+        if pending:
+            yolo_model = registry.get('yolo')
+            with registry.timed('yolo'):
+                yolo_results = yolo_model([img for _, _, img, _, _ in pending])
+            for (idx, path, img, key, lines), yolo_result in zip(pending, yolo_results):
+                # the per-slide detection summary after the batched yolo call; layout_analysis is timed on its own
+                with timed("analyze_image"):
+                    analysis = summarize_detections(yolo_result, yolo_model.names, img, path)
+                analysis["layout_analysis_results"] = layout_analysis(path, use_gpu=use_gpu, img=img, ocr_lines=lines)
+                results[idx] = analysis
+                if cache:
+                    cache.put_json(key, analysis)
+
+        analyses.extend(results[idx] for idx in range(len(paths)))
+        logging.info(f"vision analysis completed for {len(paths)} slides ({len(paths) - len(pending)} cached).")
+    return analyses
@@ -0,0 +1,367 @@
+"""offline end-to-end benchmark of main.orchestrate_process.
+
+drives the real pipeline (ocr, batching, llm dispatch, tts scheduling, audio2face
+playback) over synthetic decks with the external services replaced by local stubs:
+
+  - llm: a fake ChatNVIDIA behind the real NvidiaSession, answering every batch with one
+    script per requested slide after a configurable latency
+  - tts: fake google text_to_speech/synthesize writing silent wavs whose length is
+    proportional to the script
+  - audio2face: a local grpc server implementing PushAudio and PushAudioStream from
+    backend/audio2face.proto, "playing" the received audio at --playback-speed. it
+    counts the client connections, so a run that reuses one channel reports a single one,
+    and records when each streamed chunk arrived
+
+each deck runs in its own process so peak rss is measured per deck. per-stage latency
+percentiles come from the pipeline's progress events (see backend/progress.py).
+
+    python benchmarks/bench_pipeline.py --slides 10 100 500
+    python benchmarks/bench_pipeline.py --slides 100 --set TTS_INCREMENTAL=True --json results.json
+"""
+import os
+import io
+import ast
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import functools
+import subprocess
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the pipeline modules import each other both as backend.x and as bare x
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'backend')]
+
+WORDS = ("the quarterly results show steady growth across every region while costs remain flat "
+         "our roadmap focuses on reliability latency and developer experience for the next release "
+         "customers asked for faster onboarding better documentation and clearer pricing tiers").split()
+
+def slide_text(rng, slide_number, words):
+    return f"Slide {slide_number}\n" + " ".join(rng.choice(WORDS) for _ in range(words))
+
+def text_lines(text, words_per_line=10):
+    """the lines a slide's text is drawn in"""
+    words = text.split()
+    return [" ".join(words[start:start + words_per_line]) for start in range(0, len(words), words_per_line)]
+
+def render_deck(folder, num_slides, words, seed=0):
+    """renders num_slides slide_<n>.png images the way the rasterizer names them, returns their text"""
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:  # pillow < 10.1 only has the small bitmap font
+        font = ImageFont.load_default()
+    rng = random.Random(seed)
+    texts = []
+    for idx in range(num_slides):
+        text = slide_text(rng, idx + 1, words)
+        image = Image.new('RGB', (1280, 720), 'white')
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(text_lines(text)):
+            draw.text((60, 60 + row * 40), line, fill='black', font=font)
+        image.save(os.path.join(folder, f"slide_{idx}.png"))
+        texts.append(text)
+    return texts
+
+def page_index(path):
+    """0-based page index of a slide_<n> image"""
+    return int(os.path.splitext(os.path.basename(path))[0][len('slide_'):])
+
+def layout_regions(text):
+    """ppstructure-shaped layout results for a rendered slide: its first line as the title, the rest as one text region"""
+    regions = []
+    for row, line in enumerate(text_lines(text)):
+        bbox = [60, 60 + row * 40, 1220, 96 + row * 40]
+        recognized = {"text": line, "confidence": 0.95, "text_region": bbox}
+        if row == 0:
+            regions.append({"type": "title", "bbox": bbox, "text": [recognized]})
+        elif len(regions) == 1:
+            regions.append({"type": "text", "bbox": list(bbox), "text": [recognized]})
+        else:
+            regions[1]["bbox"][3] = bbox[3]
+            regions[1]["text"].append(recognized)
+    return regions
+
+def silent_wav(seconds, samplerate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(samplerate)
+        out.writeframes(b'\x00\x00' * int(seconds * samplerate))
+    return buffer.getvalue()
+
+class FakeChatNVIDIA:
+    """stands in for ChatNVIDIA: answers each batch with one script per slide in the prompt.
+
+    the first chunk arrives after `latency` seconds and every slide's script takes another
+    `slide_latency` seconds, for both invoke and stream.
+    """
+    def __init__(self, latency, slide_latency, words):
+        self.latency = latency
+        self.slide_latency = slide_latency
+        self.words = words
+        self.rng = random.Random(1)
+        self.calls = 0
+
+    def _slides(self, messages):
+        payload = messages[-1].content
+        return [slide["slide_number"] for slide in json.loads(payload[payload.index("Input:\n") + len("Input:\n"):])]
+
+    def _script(self, slide_number):
+        sentences = []
+        words = [self.rng.choice(WORDS) for _ in range(self.words)]
+        for start in range(0, len(words), 12):
+            sentences.append(" ".join(words[start:start + 12]).capitalize() + ".")
+        return json.dumps({"slide_number": slide_number, "presentation_text": " ".join(sentences)})
+
+    def _usage(self, messages, completion):
+        return {"input_tokens": sum(len(message.content) for message in messages) // 4, "output_tokens": len(completion) // 4}
+
+    def stream(self, messages, **params):
+        self.calls += 1
+        slides = self._slides(messages)
+        time.sleep(self.latency)
+        yield SimpleNamespace(content="[\n", usage_metadata=None, response_metadata={})
+        completion = []
+        for idx, slide_number in enumerate(slides):
+            time.sleep(self.slide_latency)
+            text = self._script(slide_number) + (",\n" if idx < len(slides) - 1 else "\n")
+            completion.append(text)
+            yield SimpleNamespace(content=text, usage_metadata=None, response_metadata={})
+        yield SimpleNamespace(content="]", usage_metadata=self._usage(messages, "".join(completion)), response_metadata={})
+
+    def invoke(self, messages, **params):
+        chunks = list(self.stream(messages, **params))
+        return SimpleNamespace(content="".join(chunk.content for chunk in chunks), usage_metadata=chunks[-1].usage_metadata, response_metadata={})
+
+class FakeTTS:
+    """silent speech at words_per_second, produced after `latency` seconds"""
+    def __init__(self, latency, words_per_second, samplerate):
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.samplerate = samplerate
+        self.calls = 0
+
+    def synthesize(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return silent_wav(len(text.split()) / self.words_per_second, self.samplerate)
+
+    def text_to_speech(self, nvidia_response_json, output_path):
+        text = "\n".join(slide["presentation_text"] for slide in nvidia_response_json if "presentation_text" in slide)
+        with open(output_path, 'wb') as out:
+            out.write(self.synthesize(text))
+
+def start_audio2face_server(playback_speed):
+    """starts a local grpc audio2face stub, returns (server, servicer, address)"""
+    import grpc
+    import audio2face_pb2
+    import audio2face_pb2_grpc
+
+    class StubAudio2Face(audio2face_pb2_grpc.Audio2FaceServicer):
+        def __init__(self):
+            self.pushes = 0
+            self.audio_seconds = 0.0
+            self.peers = set()  # client addresses, one per connection: pushes over a reused channel share one
+            self.streams = []  # per PushAudioStream call: its start marker and the arrival time and size of every chunk
+            self._lock = threading.Lock()
+
+        def _play(self, context, num_bytes, samplerate, block):
+            seconds = num_bytes / 4 / samplerate  # float32 samples
+            with self._lock:
+                self.pushes += 1
+                self.audio_seconds += seconds
+                self.peers.add(context.peer())
+            if block and playback_speed:
+                time.sleep(seconds / playback_speed)
+
+        def PushAudio(self, request, context):
+            self._play(context, len(request.audio_data), request.samplerate, request.block_until_playback_is_finished)
+            return audio2face_pb2.PushAudioResponse(success=True, message="")
+
+        def PushAudioStream(self, request_iterator, context):
+            start = next(request_iterator).start_marker
+            stream = {"instance_name": start.instance_name, "samplerate": start.samplerate, "chunks": []}
+            with self._lock:
+                self.streams.append(stream)
+            for request in request_iterator:
+                stream["chunks"].append((time.perf_counter(), len(request.audio_data)))
+            num_bytes = sum(size for _, size in stream["chunks"])
+            self._play(context, num_bytes, start.samplerate, start.block_until_playback_is_finished)
+            return audio2face_pb2.PushAudioStreamResponse(success=True, message="")
+
+    servicer = StubAudio2Face()
+    server = grpc.server(ThreadPoolExecutor(max_workers=4))
+    audio2face_pb2_grpc.add_Audio2FaceServicer_to_server(servicer, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    return server, servicer, f"127.0.0.1:{port}"
+
+def set_config(name, value):
+    # main.py reads backend.config.Config, the backend modules read config.Config
+    import config
+    import backend.config
+    for cls in (config.Config, backend.config.Config):
+        setattr(cls, name, value)
+
+def percentiles(values, points=(50, 90, 99)):
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {f"p{point}": values[min(len(values) - 1, int(round(point / 100 * (len(values) - 1))))] for point in points}
+    result["max"] = values[-1]
+    result["count"] = len(values)
+    return result
+
+def stage_latencies(events):
+    durations = {}
+    for event in events:
+        if event["type"] == "end":
+            durations.setdefault(event["stage"], []).append(event["duration"])
+    return {stage: percentiles(values) for stage, values in sorted(durations.items())}
+
+def run_deck(args, num_slides):
+    """runs the pipeline once over a synthetic deck of num_slides slides and returns its measurements"""
+    import main
+    import backend.nvidia_api
+    import backend.audio2face_module
+    from backend.ocr import process_images
+    from backend.rasterize import PageImages
+    from backend.progress import stage_event
+
+    logging.getLogger().setLevel(args.log_level)
+    set_config('CACHE_ENABLED', args.cache)
+    for assignment in args.set:
+        name, value = assignment.split('=', 1)
+        set_config(name, ast.literal_eval(value))
+
+    workdir = tempfile.mkdtemp(prefix='clara-bench-')
+    image_folder = os.path.join(workdir, 'images')
+    output_folder = os.path.join(workdir, 'outputs')
+    os.makedirs(image_folder)
+    os.makedirs(output_folder)
+    server = None
+    try:
+        texts = render_deck(image_folder, num_slides, args.words_per_slide)
+
+        def process_presentation(file_path, state=None):
+            # the rendered pngs stand in for the libreoffice/rasterizer output
+            pages = PageImages.from_folder(image_folder)
+            if args.ocr == 'stub':
+                return [{"slide_number": idx + 1, "text": "\n".join(text_lines(text))} for idx, text in enumerate(texts)], pages
+            with stage_event(state, "ocr"):
+                return process_images(image_folder, state), pages
+
+        def stub_image_analysis(image_paths, **kwargs):
+            # the layout regions of the rendered text, so the payload compactor has the real analysis shape to merge
+            time.sleep(args.vision_latency * len(image_paths))
+            return [{"object_detection_model_description": "detected 0 objects.", "object_detection_tags": [],
+                     "object_detection_objects": [], "layout_analysis_results": layout_regions(texts[page_index(path)])} for path in image_paths]
+
+        llm = FakeChatNVIDIA(args.llm_latency, args.llm_slide_latency, args.words_per_slide)
+        backend.nvidia_api._session = backend.nvidia_api.NvidiaSession(llm=llm)
+        tts = FakeTTS(args.tts_latency, args.words_per_second, args.tts_samplerate)
+        server, audio2face, address = start_audio2face_server(args.playback_speed)
+
+        main.process_presentation = process_presentation
+        if args.vision == 'stub':
+            main.get_image_analysis_batch = stub_image_analysis
+        main.google_text_to_speech = tts.text_to_speech
+        main.google_synthesize = tts.synthesize
+        for name in ('push_audio_to_audio2face', 'push_audio_stream_to_audio2face', 'push_audio_chunks_to_audio2face'):
+            setattr(main, name, functools.partial(getattr(backend.audio2face_module, name), url=address))
+
+        events = []
+        state = {"is_processing": True, "should_continue": True, "current_slide": 0, "emit": events.append}
+        start = time.time()
+        result = main.orchestrate_process(os.path.join(workdir, f"bench-{num_slides}.pptx"), output_folder, state)
+        wall = time.time() - start
+
+        first_audio = next((event["start"] - start for event in events if event["stage"] == "audio2face" and event["type"] == "start"), None)
+        return {
+            "slides": num_slides,
+            "status": result.get("status", result.get("error")),
+            "wall_seconds": wall,
+            "first_audio_seconds": first_audio,
+            "slides_played": audio2face.pushes,
+            "a2f_connections": len(audio2face.peers),
+            "audio_seconds": audio2face.audio_seconds,
+            "llm_requests": llm.calls,
+            "tts_requests": tts.calls,
+            "stages": stage_latencies(events),
+            "slide_gap_seconds": percentiles(list(result.get("slide_gap_seconds", {}).values())),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        }
+    finally:
+        if server is not None:
+            server.stop(grace=None)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def print_report(result):
+    print(f"\n== {result['slides']} slides: {result['status']} ==")
+    first_audio = result['first_audio_seconds']
+    print(f"wall {result['wall_seconds']:.2f}s, first audio {first_audio:.2f}s" if first_audio is not None else f"wall {result['wall_seconds']:.2f}s, no audio played")
+    print(f"played {result['slides_played']} slides ({result['audio_seconds']:.0f}s of audio) over {result['a2f_connections']} audio2face connections, {result['llm_requests']} llm requests, {result['tts_requests']} tts requests")
+    print(f"peak rss {result['peak_rss_mb']:.0f} MB (ocr workers {result['peak_child_rss_mb']:.0f} MB)")
+    print(f"{'stage':<16}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    rows = dict(result['stages'])
+    if result['slide_gap_seconds']:
+        rows['slide gap'] = result['slide_gap_seconds']
+    for stage, stats in rows.items():
+        print(f"{stage:<16}{stats['count']:>7}" + "".join(f"{stats[key]:>10.3f}" for key in ('p50', 'p90', 'p99', 'max')))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--slides', type=int, nargs='+', default=[10, 100, 500], help='deck sizes to run')
+    parser.add_argument('--ocr', choices=['real', 'stub'], default='real', help='run tesseract on the rendered slides or use their known text')
+    parser.add_argument('--vision', choices=['real', 'stub'], default='stub', help='run yolo/ppstructure or return empty analyses')
+    parser.add_argument('--vision-latency', type=float, default=0.05, help='seconds per slide of the vision stub')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='seconds before the first chunk of each llm request')
+    parser.add_argument('--llm-slide-latency', type=float, default=0.2, help='seconds to generate each slide\'s script')
+    parser.add_argument('--tts-latency', type=float, default=0.2, help='seconds per tts request')
+    parser.add_argument('--tts-samplerate', type=int, default=8000)
+    parser.add_argument('--words-per-slide', type=int, default=60)
+    parser.add_argument('--words-per-second', type=float, default=2.5, help='speaking rate of the fake tts')
+    parser.add_argument('--playback-speed', type=float, default=100.0, help='audio2face stub plays audio this many times faster than real time, 0 to not wait')
+    parser.add_argument('--cache', action='store_true', help='keep the result caches enabled')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='override a Config attribute, e.g. TTS_INCREMENTAL=True')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.single is not None:
+        print(json.dumps(run_deck(args, args.single)))
+        return
+
+    results = []
+    for num_slides in args.slides:
+        # a fresh process per deck, so peak rss isn't carried over from a previous run
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--single', str(num_slides)],
+                                 stdout=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            print(f"\n== {num_slides} slides: benchmark failed (exit code {process.returncode}) ==")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=4)
+
+if __name__ == '__main__':
+    main()
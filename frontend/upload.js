@@ -1,3 +1,70 @@
+let currentJobId = null;
+
+function showStatus(message) {
+    document.getElementById('status').textContent = message;
+}
+
+function stageLabel(event) {
+    let label = event.stage;
+    if (event.slide !== undefined) {
+        label += ` slide ${event.slide}`;
+    } else if (event.slides !== undefined) {
+        label += ` slides ${event.slides[0]}-${event.slides[event.slides.length - 1]}`;
+    }
+    return label;
+}
+
+function showStage(event) {
+    const list = document.getElementById('progress');
+    const id = `stage-${stageLabel(event).replace(/\s+/g, '-')}`;
+    let item = document.getElementById(id);
+    if (!item) {
+        item = document.createElement('li');
+        item.id = id;
+        list.appendChild(item);
+    }
+    if (event.type === 'start') {
+        item.textContent = `${stageLabel(event)}: running`;
+    } else {
+        const outcome = event.ok ? 'done' : 'failed';
+        item.textContent = `${stageLabel(event)}: ${outcome} in ${event.duration.toFixed(2)}s`;
+    }
+}
+
+function watchJob(jobId) {
+    document.getElementById('progress').innerHTML = '';
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        source.addEventListener('status', event => {
+            showStatus(`job ${jobId}: ${JSON.parse(event.data).status}`);
+        });
+        source.addEventListener('start', event => showStage(JSON.parse(event.data)));
+        source.addEventListener('end', event => showStage(JSON.parse(event.data)));
+        source.addEventListener('done', async event => {
+            source.close();
+            const done = JSON.parse(event.data);
+            const duration = done.duration !== undefined ? ` in ${done.duration.toFixed(1)}s` : '';
+            showStatus(`job ${jobId}: ${done.status}${duration}`);
+            try {
+                const response = await fetch(`/jobs/${jobId}`);
+                const job = await response.json();
+                if (job.result && job.result.error) {
+                    alert(`error processing presentation: ${job.result.error}`);
+                }
+                resolve(job);
+            } catch (error) {
+                reject(error);
+            }
+        });
+        // EventSource reconnects on its own (resuming from Last-Event-ID); only give up once it has closed
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('lost the progress stream'));
+            }
+        };
+    });
+}
+
 document.getElementById('upload-form').addEventListener('submit', async function(event) {
     event.preventDefault();
     const fileInput = document.getElementById('file-input');
@@ -18,6 +85,8 @@ document.getElementById('upload-form').addEventListener('submit', async function
             }
 
             const result = await response.json();
+            currentJobId = result.job_id;
+            await watchJob(currentJobId);
         } catch (error) {
             console.error('error during upload:', error);
             alert(`error during upload: ${error.message}`);
@@ -27,6 +96,25 @@ document.getElementById('upload-form').addEventListener('submit', async function
     }
 });
 
+document.getElementById('cancel-button').addEventListener('click', async function() {
+    if (!currentJobId) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/jobs/${currentJobId}/cancel`, {
+            method: 'POST'
+        });
+
+        if (!response.ok) {
+            throw new Error('network response was not ok');
+        }
+    } catch (error) {
+        console.error('error cancelling job:', error);
+        alert(`error cancelling job: ${error.message}`);
+    }
+});
+
 document.getElementById('stop-button').addEventListener('click', async function() {
     try {
         const response = await fetch('/stop-audio2face', {
@@ -1,16 +1,25 @@
 import os
 import logging
-import json
 import uuid
 import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from backend.ocr import process_presentation
-from backend.nvidia_api import process_with_nvidia_api
-from backend.google_tts import text_to_speech as google_text_to_speech
+from backend.nvidia_api import process_with_nvidia_api, stream_with_nvidia_api, valid_slide_number, INSTRUCTIONS
+from backend.json_stream import extract_json_array
+from backend.batching import BatchPlanner, count_tokens, max_output_tokens
+from backend.payload import compact_slide
+from backend.google_tts import text_to_speech as google_text_to_speech, synthesize as google_synthesize, voice_params as google_voice_params
 # from backend.elevenlabs_tts import text_to_speech as elevenlabs_text_to_speech # uncomment this line if you want to use ElevenLabs for TTS
-from backend.vision_analysis import get_image_analysis
+from backend.vision_analysis import get_image_analysis_batch
 from backend.config import Config
-from backend.utils import wait_for_file
-from backend.audio2face_module import push_audio_to_audio2face
+from backend.progress import stage_event, emit_event, record_stage
+from backend.utils import RateLimiter
+from backend.audio2face_module import push_audio_to_audio2face, push_audio_stream_to_audio2face, push_audio_chunks_to_audio2face
+from backend.incremental_tts import IncrementalSpeech
+from backend.deck_history import DeckHistory
 
 # set up logging
 logging.basicConfig(level=logging.INFO)
@@ -23,88 +32,449 @@ os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(Config.IMAGE_FOLDER, exist_ok=True)
 os.makedirs(Config.MODELS_FOLDER, exist_ok=True)
 
-def process_batch(slide_data_batch, output_folder, pptx_filename, batch_num, state):
-    if not state["should_continue"]:
-        logging.info(f"Processing stopped at batch {batch_num}")
-        return
-    
+# marks the end of a stage's output
+DONE = object()
+
+# audio2face player instances. a job holds one for its whole playback, so concurrent jobs never
+# interleave their slides on the same avatar; with a single instance their playback is serialized
+_players = queue.Queue()
+for _instance in Config.A2F_INSTANCE_NAMES:
+    _players.put(_instance)
+
+def acquire_player(audio_queue):
+    """waits for a free audio2face player instance, returns None when the pipeline stops first"""
+    while audio_queue.running():
+        try:
+            return _players.get(timeout=Config.PIPELINE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
+
+class StageQueue:
+    """bounded queue between two pipeline stages.
+
+    put/get wake up periodically so that a stage blocked on a full or empty queue
+    notices when processing is stopped (state["should_continue"]) or another stage failed.
+    """
+    def __init__(self, state, abort, maxsize=Config.PIPELINE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.state = state
+        self.abort = abort
+
+    def running(self):
+        return self.state["should_continue"] and not self.abort.is_set()
+
+    def put(self, item):
+        while self.running():
+            try:
+                self.queue.put(item, timeout=Config.PIPELINE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self):
+        while self.running():
+            try:
+                return self.queue.get(timeout=Config.PIPELINE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return DONE
+
+def run_stage(name, target, abort, out_queue, *args):
+    """runs a pipeline stage, always signalling DONE downstream and aborting the pipeline on failure"""
     try:
-        nvidia_response_json = json.loads(process_with_nvidia_api(slide_data_batch))
-        if "error" in nvidia_response_json:
-            logging.error(f"error processing batch {batch_num}: {nvidia_response_json['error']}")
+        target(*args, out_queue)
+    except Exception as e:
+        logging.error(f"pipeline stage {name} failed: {e}")
+        abort.set()
+    finally:
+        out_queue.put(DONE)
+
+def vision_stage(slide_data, pages, out_queue):
+    batch_size = Config.VISION_BATCH_SIZE
+    batch = []
+    for slide in slide_data:
+        reused = slide.pop("reused", False)
+        if not reused:
+            batch.append(slide)
+            if len(batch) < batch_size:
+                continue
+        if batch and not analyse_batch(batch, pages, out_queue):
             return
+        batch = []
+        # slides analysed on an earlier upload of the deck go straight through, after the slides before them
+        if reused and not out_queue.put(slide):
+            return
+    if batch:
+        analyse_batch(batch, pages, out_queue)
 
-        generate_tts_per_slide(nvidia_response_json, output_folder, pptx_filename, state)
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error during batch processing: {e}")
-    except Exception as e:
-        logging.error(f"Failed to process batch {batch_num}: {e}")
+def analyse_batch(batch, pages, out_queue):
+    """runs vision over a batch of slides and hands them on, returns False when the pipeline stopped"""
+    history = out_queue.state.get("deck_history")
+    # slides whose text came from the pptx xml and that have no pictures or charts skip vision
+    needs_raster = {slide["slide_number"]: slide.pop("needs_raster", True) for slide in batch}
+    indexes = [slide["slide_number"] - 1 for slide in batch if needs_raster[slide["slide_number"]]]
+    images = {idx: pages.get(idx) for idx in indexes}
+    # the ocr stage's tesseract lines give the layout regions their text, they aren't part of the LLM payload
+    lines = {slide["slide_number"] - 1: slide.pop("ocr_lines", None) for slide in batch}
+    ready = [idx for idx in indexes if images[idx] is not None]
+    with stage_event(out_queue.state, "vision", slides=[slide["slide_number"] for slide in batch]):
+        results = get_image_analysis_batch([pages.path(idx) for idx in ready], batch_size=Config.VISION_BATCH_SIZE,
+                                           images=[images[idx] for idx in ready], ocr_lines=[lines[idx] for idx in ready])
+    analyses = dict(zip(ready, results))
+    for idx in indexes:
+        pages.discard(idx)
+
+    for slide in batch:
+        idx = slide["slide_number"] - 1
+        image_path = pages.path(idx)
+        analysis = analyses.get(idx)
+        if not needs_raster[slide["slide_number"]]:
+            slide["image_analysis"] = {}
+        elif analysis is not None:
+            slide["image_analysis"] = analysis
+            logging.info(f"processing image {image_path} with vision analysis completed.")
+        else:
+            logging.error(f"image {image_path} not found or not created.")
+            slide["image_analysis"] = {}
+        if history and (analysis is not None or not needs_raster[slide["slide_number"]]):
+            # kept by fingerprint, so the next upload of the deck skips this slide if it is unchanged
+            history.remember_slide(slide)
+
+        if not out_queue.put(slide):
+            return False
+    return True
+
+def continuation_context(previous_slides):
+    """short summary of the slides before a batch, so a batch generated in parallel still reads as a continuation"""
+    lines = []
+    for slide in previous_slides:
+        text = " ".join((slide.get("text") or "").split())
+        if len(text) > Config.LLM_CONTEXT_CHARS_PER_SLIDE:
+            text = text[:Config.LLM_CONTEXT_CHARS_PER_SLIDE].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"slide {slide['slide_number']}: {text}")
+    return "\n".join(lines)
+
+def request_scripts(batch, batch_num, max_tokens, context):
+    if Config.LLM_STREAMING:
+        return stream_with_nvidia_api(batch, max_tokens=max_tokens, context=context)
+    return process_batch(batch, batch_num, max_tokens=max_tokens, context=context)
+
+def generate_batch_scripts(batch, batch_num, max_tokens, context, results_queue):
+    with stage_event(results_queue.state, "llm_batch", batch=batch_num, slides=[slide["slide_number"] for slide in batch]):
+        release_batch_scripts(batch, batch_num, max_tokens, context, results_queue)
+
+def release_batch_scripts(batch, batch_num, max_tokens, context, results_queue):
+    """runs one LLM batch on a dispatcher thread, putting each script on results_queue in slide order.
+
+    scripts are validated against the requested slide numbers; slides that are missing or
+    invalid are re-requested on their own (up to Config.LLM_SLIDE_RETRIES times) instead of
+    redoing the whole batch. a script is released as soon as every earlier slide has one.
+    """
+    expected = [slide["slide_number"] for slide in batch]
+    received = {}
+    emitted = 0
+    pending = batch
+    for attempt in range(Config.LLM_SLIDE_RETRIES + 1):
+        for script in request_scripts(pending, batch_num, max_tokens, context):
+            number = valid_slide_number(script, expected)
+            if number is None or number in received:
+                logging.warning(f"batch {batch_num}: ignoring invalid or duplicate script {str(script)[:200]}")
+                continue
+            received[number] = {**script, "slide_number": number}
+            while emitted < len(expected) and expected[emitted] in received:
+                if not results_queue.put(received[expected[emitted]]):
+                    return
+                emitted += 1
+        pending = [slide for slide in batch if slide["slide_number"] not in received]
+        if not pending or not results_queue.running():
+            break
+        if attempt < Config.LLM_SLIDE_RETRIES:
+            logging.warning(f"batch {batch_num}: no valid script for slides {[slide['slide_number'] for slide in pending]}, re-requesting them")
+
+    # release what's left in order, skipping slides that never got a script
+    for number in expected[emitted:]:
+        if number not in received:
+            logging.error(f"batch {batch_num}: no script for slide {number} after {Config.LLM_SLIDE_RETRIES} retries, skipping it")
+        elif not results_queue.put(received[number]):
+            return
+
+def submit_batches(executor, in_queue, batches_queue):
+    """packs analysed slides into token-budgeted batches and dispatches them to the LLM pool.
+
+    a batch whose slides are all unchanged since the previous upload of the deck, at the same
+    positions, gets that upload's scripts instead of an LLM request.
+    """
+    history = in_queue.state.get("deck_history")
+    planner = BatchPlanner(count_tokens(INSTRUCTIONS))
+    in_queue.state["llm_batches"] = planner.report
+    in_queue.state["payload_tokens"] = []
+    previous = deque(maxlen=Config.LLM_CONTEXT_SLIDES)
+    while True:
+        slide = in_queue.get()
+        if slide is DONE:
+            batch = planner.flush()
+        else:
+            payload, report = compact_slide(slide)
+            in_queue.state["payload_tokens"].append(report)
+            batch = planner.add(payload)
+        if batch and in_queue.running():
+            batch_num = len(planner.report) - 1
+            # let the response use whatever context the prompt leaves free
+            max_tokens = max_output_tokens(planner.report[batch_num]["prompt_tokens"], len(batch))
+            context = continuation_context(previous) if previous else None
+            results_queue = StageQueue(in_queue.state, in_queue.abort, maxsize=0)
+            numbers = [slide["slide_number"] for slide in batch]
+            scripts = history.previous_scripts(numbers) if history else None
+            if scripts is not None:
+                logging.info(f"llm batch {batch_num}: slides {numbers} are unchanged, reusing their scripts.")
+                planner.report[batch_num]["reused"] = True
+                for script in scripts:
+                    results_queue.put(script)
+                results_queue.put(DONE)
+            else:
+                executor.submit(run_stage, f"llm-batch-{batch_num}", generate_batch_scripts, in_queue.abort, results_queue, batch, batch_num, max_tokens, context)
+            if not batches_queue.put((numbers, scripts is not None, results_queue)):
+                return
+            previous.extend(batch)
+        if slide is DONE:
+            return
+
+def llm_stage(in_queue, out_queue):
+    """generates scripts for up to Config.LLM_MAX_IN_FLIGHT batches concurrently and emits them in slide order.
+
+    the batch at the head of the order is streamed straight through, later batches buffer
+    their scripts until every earlier batch has been emitted.
+    """
+    history = in_queue.state.get("deck_history")
+    batches_queue = StageQueue(in_queue.state, in_queue.abort, maxsize=Config.LLM_MAX_IN_FLIGHT)
+    executor = ThreadPoolExecutor(max_workers=Config.LLM_MAX_IN_FLIGHT, thread_name_prefix="llm")
+    submitter = threading.Thread(target=run_stage, args=("llm-submit", submit_batches, in_queue.abort, batches_queue, executor, in_queue), daemon=True)
+    submitter.start()
+    try:
+        while True:
+            item = batches_queue.get()
+            if item is DONE:
+                return
+            numbers, reused, results_queue = item
+            scripts = []
+            while True:
+                script = results_queue.get()
+                if script is DONE:
+                    break
+                scripts.append(script)
+                if not out_queue.put(script):
+                    return
+            # only a batch with a script for every slide is worth reusing on the next upload
+            if history and [script["slide_number"] for script in scripts] == numbers:
+                history.record_batch(numbers, scripts, reused=reused)
+    finally:
+        submitter.join()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def submit_tts(output_folder, pptx_filename, executor, limiter, incremental, in_queue, futures_queue):
+    while True:
+        slide = in_queue.get()
+        if slide is DONE:
+            return
+        if incremental:
+            # sentences are synthesized in the background and streamed by the playback loop
+            slide_number = slide["slide_number"]
+            emit_event(in_queue.state, {"type": "start", "stage": "tts", "slide": slide_number, "start": time.time()})
+            work = IncrementalSpeech(slide.get("presentation_text", ""), "google", google_voice_params(), google_synthesize, executor, limiter,
+                                     on_complete=lambda start, end, slide_number=slide_number: record_stage(in_queue.state, "tts", start, end, slide=slide_number))
+        else:
+            work = executor.submit(synthesize_slide_audio, slide, output_folder, pptx_filename, limiter, in_queue.state)
+        if not futures_queue.put((slide["slide_number"], work)):
+            return
+
+def tts_stage(output_folder, pptx_filename, in_queue, out_queue):
+    """synthesizes upcoming slides concurrently and hands their audio on strictly in slide order.
+
+    up to Config.TTS_LOOKAHEAD slides are in flight or waiting ahead of playback, with at most
+    Config.TTS_MAX_WORKERS requests running at once and Config.TTS_RATE_LIMIT starting per second.
+    """
+    limiter = RateLimiter(Config.TTS_RATE_LIMIT)
+    futures_queue = StageQueue(in_queue.state, in_queue.abort, maxsize=Config.TTS_LOOKAHEAD)
+    executor = ThreadPoolExecutor(max_workers=Config.TTS_MAX_WORKERS, thread_name_prefix="tts")
+    # sentence pieces can only be played through the PushAudioStream rpc
+    incremental = Config.TTS_INCREMENTAL and Config.A2F_STREAMING
+    if Config.TTS_INCREMENTAL and not incremental:
+        logging.warning("TTS_INCREMENTAL requires A2F_STREAMING, synthesizing whole slides instead.")
+    submitter = threading.Thread(target=run_stage, args=("tts-submit", submit_tts, in_queue.abort, futures_queue, output_folder, pptx_filename, executor, limiter, incremental, in_queue), daemon=True)
+    submitter.start()
+    try:
+        while True:
+            item = futures_queue.get()
+            if item is DONE:
+                return
+            slide_number, work = item
+            if isinstance(work, IncrementalSpeech):
+                audio = work
+            else:
+                try:
+                    audio = work.result()
+                except Exception as e:
+                    logging.error(f"TTS failed for slide {slide_number}: {e}")
+                    continue
+            if not out_queue.put((slide_number, audio)):
+                return
+    finally:
+        submitter.join()
+        # queued sentence synthesis must keep running for slides already handed to playback
+        executor.shutdown(wait=False, cancel_futures=not in_queue.running())
+
+def process_batch(slide_data_batch, batch_num, max_tokens=Config.LLM_MAX_OUTPUT_TOKENS, context=None):
+    """sends one batch of slides to the LLM and returns the script objects recovered from the response"""
+    response = process_with_nvidia_api(slide_data_batch, max_tokens=max_tokens, context=context)
+    if response is None:
+        logging.error(f"failed to process batch {batch_num}")
+        return []
+    scripts = extract_json_array(response)
+    if not scripts:
+        logging.error(f"no JSON slide objects found in the response for batch {batch_num}: {response[:500]}")
+    return scripts
 
 def orchestrate_process(file_path, output_folder, state):
+    """runs the presentation pipeline.
+
+    vision analysis, LLM script generation, TTS and Audio2Face playback run as separate
+    stages connected by bounded queues, so the next batch's scripts and the next slide's
+    audio are produced while the current slide is playing.
+    """
     logging.info(f"starting orchestration process for file: {file_path}")
     
     pptx_filename = os.path.basename(file_path)
     
-    slide_data, image_folder = process_presentation(file_path)
+    # what this deck's previous upload left behind, so only edited slides are processed again
+    history = DeckHistory(file_path) if Config.INCREMENTAL_REPROCESSING else None
+    state["deck_history"] = history
+    if history and history.previous:
+        logging.info(f"slides changed since the previous upload of {pptx_filename}: {history.changed_slides()}")
+
+    slide_data, pages = process_presentation(file_path, state)
     
     if slide_data is None:
         return {"error": "failed to process presentation for OCR."}
 
     logging.info("OCR processing completed.")
-    
-    for slide in slide_data:
-        if not state["should_continue"]:
-            logging.info("processing stopped.")
-            return {"message": "processing stopped.", "status": "stopped"}
-
-        slide_number = slide["slide_number"]
-        image_path = os.path.join(image_folder, f"slide_{slide_number - 1}.png")
-        
-        if wait_for_file(image_path):
-            analysis = get_image_analysis(image_path)
-            slide["image_analysis"] = {k: v for k, v in analysis.items() if k != "ocr_text"}
-            slide["text"] = analysis.get("ocr_text", slide["text"])
-            logging.info(f"processing image {image_path} with vision analysis completed.")
-        else:
-            logging.error(f"image {image_path} not found or not created.")
-            slide["image_analysis"] = {}
 
-    # batch processing
-    batch_size = 5
-    num_batches = (len(slide_data) + batch_size - 1) // batch_size
+    abort = threading.Event()
+    analyzed_queue = StageQueue(state, abort)
+    script_queue = StageQueue(state, abort)
+    audio_queue = StageQueue(state, abort)
+    stages = [
+        threading.Thread(target=run_stage, args=("vision", vision_stage, abort, analyzed_queue, slide_data, pages), daemon=True),
+        threading.Thread(target=run_stage, args=("llm", llm_stage, abort, script_queue, analyzed_queue), daemon=True),
+        threading.Thread(target=run_stage, args=("tts", tts_stage, abort, audio_queue, output_folder, pptx_filename, script_queue), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # playback is driven from the calling thread, in slide order. pushes run on their own thread,
+    # so the next slide's audio is fetched and readied while the current one plays. the gap of a
+    # slide is the dead air between the previous slide finishing (or the pipeline starting) and its first audio
+    state["slide_gap_seconds"] = {}
+    player = ThreadPoolExecutor(max_workers=1, thread_name_prefix="a2f")
+    playing = None
+    instance = None
+    last_played = time.perf_counter()
+    try:
+        while True:
+            item = audio_queue.get()
+            if item is DONE:
+                break
+            slide_number, audio = item
+            if isinstance(audio, IncrementalSpeech):
+                try:
+                    audio.samplerate  # blocks until the first sentence is synthesized
+                except Exception as e:
+                    logging.error(f"TTS failed for slide {slide_number}: {e}")
+                    audio.cancel()
+                    continue
+            if instance is None:
+                instance = acquire_player(audio_queue)
+                if instance is None:
+                    if isinstance(audio, IncrementalSpeech):
+                        audio.cancel()
+                    break
+                last_played = time.perf_counter()  # time spent waiting for another job's playback isn't dead air
+            if playing is not None:
+                last_played = playing.result()  # pushes block until audio2face finished playing the slide
+                playing = None
+                if not audio_queue.running():
+                    # stopped while the previous slide was playing, don't start the next one
+                    if isinstance(audio, IncrementalSpeech):
+                        audio.cancel()
+                    break
+            gap = time.perf_counter() - last_played
+            state["slide_gap_seconds"][slide_number] = gap
+            logging.info(f"slide {slide_number} gap latency: {gap * 1000:.0f} ms")
+            playing = player.submit(play_slide, state, slide_number, audio, gap, instance)
+        if playing is not None:
+            playing.result()
+    finally:
+        player.shutdown()
+        if instance is not None:
+            _players.put(instance)
 
-    for batch_num in range(num_batches):
-        if not state["should_continue"]:
-            logging.info("Processing stopped.")
-            return {"message": "processing stopped.", "status": "stopped"}
-        
-        slide_data_batch = slide_data[batch_num * batch_size:(batch_num + 1) * batch_size]
-        process_batch(slide_data_batch, output_folder, pptx_filename, batch_num, state)
+    for stage in stages:
+        stage.join()
+
+    if not state["should_continue"]:
+        logging.info("processing stopped.")
+        return {"message": "processing stopped.", "status": "stopped"}
+    if abort.is_set():
+        return {"error": "presentation pipeline failed, see logs for details."}
 
     logging.info("all batches processing completed.")
     state["current_slide"] = len(slide_data)  # update the state to reflect the completion
+    if history:
+        history.save()
 
     return {
         "message": "presentation audio generation and processing completed.",
         "status": "completed",
+        "slide_gap_seconds": state["slide_gap_seconds"],
+        "llm_batches": state.get("llm_batches", []),
+        "payload_tokens": state.get("payload_tokens", []),
+        "incremental": history.report() if history else None,
     }
 
-def generate_tts_per_slide(nvidia_response_json, output_folder, pptx_filename, state):
-    for slide in nvidia_response_json:
-        if not state["should_continue"]:
-            logging.info("processing stopped.")
-            return
-
-        slide_number = slide["slide_number"]
-        audio_filename = f"{pptx_filename[:10]}-slide_audio{slide_number}.wav"
-        audio_path = os.path.join(output_folder, audio_filename)
-        logging.debug(f"generating TTS for slide {slide_number} to {audio_path}")
+def synthesize_slide_audio(slide, output_folder, pptx_filename, limiter=None, state=None):
+    slide_number = slide["slide_number"]
+    audio_filename = f"{pptx_filename[:10]}-slide_audio{slide_number}.wav"
+    audio_path = os.path.join(output_folder, audio_filename)
+    logging.debug(f"generating TTS for slide {slide_number} to {audio_path}")
+    if limiter:
+        limiter.acquire()
+    with stage_event(state, "tts", slide=slide_number):
         google_text_to_speech([slide], audio_path)
-        #elevenlabs_text_to_speech([slide], audio_path) # uncomment this line and remove the google_text_to_speech call above in order to use ElevenLabs TTS in place of Google TTS
-        logging.info(f"generated audio for slide {slide_number} at {audio_path}")
-        # Push audio to Audio2Face
-        push_audio_to_audio2face(audio_path, "/World/audio2face/PlayerStreaming")
-    logging.info("TTS processing completed for all slides.")
+    #elevenlabs_text_to_speech([slide], audio_path) # uncomment this line and remove the google_text_to_speech call above in order to use ElevenLabs TTS in place of Google TTS
+    logging.info(f"generated audio for slide {slide_number} at {audio_path}")
+    return audio_path
+
+def play_slide(state, slide_number, audio, gap, instance_name):
+    """pushes a slide to Audio2Face and returns when it finished playing"""
+    with stage_event(state, "audio2face", slide=slide_number, gap=gap):
+        push_slide_audio(audio, instance_name)
+    state["current_slide"] = slide_number
+    return time.perf_counter()
+
+def push_slide_audio(audio, instance_name=Config.A2F_INSTANCE_NAMES[0]):
+    """pushes a slide's audio (a wav path or an IncrementalSpeech) to an Audio2Face player instance"""
+    if isinstance(audio, IncrementalSpeech):
+        success = push_audio_chunks_to_audio2face(audio.chunks(), audio.samplerate, instance_name)
+        if not success:
+            audio.cancel()
+        return
+    audio_path = audio
+    # Push audio to Audio2Face
+    if Config.A2F_STREAMING:
+        push_audio_stream_to_audio2face(audio_path, instance_name)
+    else:
+        push_audio_to_audio2face(audio_path, instance_name)
 
 if __name__ == "__main__":
     file_path = os.path.join(Config.UPLOAD_FOLDER, 'your_test_file.pptx')
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the backend modules import each other by bare name, like the pipeline does; the root
+# makes the benchmark's stubs (benchmarks/bench_pipeline.py) importable
+sys.path[:0] = [os.path.join(ROOT, 'backend'), ROOT]
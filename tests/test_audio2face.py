@@ -0,0 +1,75 @@
+import time
+import asyncio
+import pytest
+
+pytest.importorskip("grpc")
+pytest.importorskip("google.protobuf")
+np = pytest.importorskip("numpy")
+soundfile = pytest.importorskip("soundfile")
+import audio2face_module
+from benchmarks.bench_pipeline import start_audio2face_server
+
+INSTANCE = "/World/audio2face/PlayerStreaming"
+
+@pytest.fixture
+def audio2face():
+    """a local audio2face stub that doesn't wait for playback, yields (servicer, address)"""
+    server, servicer, address = start_audio2face_server(playback_speed=0)
+    yield servicer, address
+    audio2face_module.close_clients()
+    server.stop(grace=None)
+
+def test_wav_is_streamed_in_fixed_size_chunks(audio2face, tmp_path):
+    servicer, address = audio2face
+    path = str(tmp_path / "slide.wav")
+    soundfile.write(path, np.zeros(20000, dtype=np.float32), 16000)
+    assert audio2face_module.push_audio_stream_to_audio2face(path, INSTANCE, url=address, chunk_size=8192)
+    stream, = servicer.streams
+    assert stream["instance_name"] == INSTANCE and stream["samplerate"] == 16000
+    # float32 samples, the last chunk holds the remainder
+    assert [size for _, size in stream["chunks"]] == [8192 * 4, 8192 * 4, (20000 - 2 * 8192) * 4]
+
+def test_chunks_arrive_while_the_audio_is_still_being_produced(audio2face):
+    servicer, address = audio2face
+    def slow_chunks():
+        for _ in range(3):
+            yield np.zeros(1000, dtype=np.float32)
+            time.sleep(0.2)
+    assert audio2face_module.push_audio_chunks_to_audio2face(slow_chunks(), 16000, INSTANCE, url=address)
+    arrivals = [arrival for arrival, _ in servicer.streams[0]["chunks"]]
+    assert len(arrivals) == 3
+    assert arrivals[-1] - arrivals[0] >= 0.3
+
+def test_pushes_reuse_one_channel(audio2face):
+    servicer, address = audio2face
+    audio = np.zeros(1600, dtype=np.float32)
+    for _ in range(3):
+        assert audio2face_module.push_audio_chunks_to_audio2face([audio], 16000, INSTANCE, url=address)
+    audio2face_module.get_client(address).push(audio, 16000, INSTANCE)
+    assert servicer.pushes == 4
+    assert len(servicer.peers) == 1
+
+def test_async_client_pushes_over_one_channel(audio2face):
+    servicer, address = audio2face
+    async def push():
+        client = audio2face_module.AsyncAudio2FaceClient(address)
+        try:
+            await client.push(np.zeros(1600, dtype=np.float32), 16000, INSTANCE)
+            await client.push_stream([np.zeros(800, dtype=np.float32)] * 2, 16000, INSTANCE)
+        finally:
+            await client.close()
+    asyncio.run(push())
+    assert servicer.pushes == 2
+    assert len(servicer.peers) == 1
+    assert len(servicer.streams[0]["chunks"]) == 2
+
+def test_push_fails_at_its_deadline():
+    # a stub that plays in real time, so one second of audio holds the call for a second
+    server, servicer, address = start_audio2face_server(playback_speed=1)
+    try:
+        start = time.perf_counter()
+        assert not audio2face_module.push_audio_chunks_to_audio2face([np.zeros(16000, dtype=np.float32)], 16000, INSTANCE, url=address, timeout=0.2)
+        assert time.perf_counter() - start < 0.9
+    finally:
+        audio2face_module.close_clients()
+        server.stop(grace=None)
@@ -0,0 +1,37 @@
+from config import Config
+from batching import BatchPlanner, fit_slide, max_output_tokens, slide_tokens
+
+INSTRUCTION_TOKENS = 1000
+
+def oversized_slide(slide_number=1):
+    # far more text than a whole batch may use
+    return {"slide_number": slide_number, "text": "lorem ipsum dolor sit amet " * 50000,
+            "objects": [{"name": "person", "confidence": 0.9, "bbox": [0, 0, 10, 10]}]}
+
+def test_oversized_slide_is_trimmed_to_the_budget():
+    planner = BatchPlanner(INSTRUCTION_TOKENS, max_slides=5, first_batch_max_slides=5)
+    assert planner.add(oversized_slide()) is None
+    batch = planner.flush()
+
+    assert [slide["slide_number"] for slide in batch] == [1]
+    assert "objects" not in batch[0]
+    assert batch[0]["text"].startswith("lorem ipsum")
+    report = planner.report[0]
+    assert report["prompt_tokens"] + report["expected_output_tokens"] <= Config.LLM_TOKEN_BUDGET
+
+def test_oversized_slide_leaves_room_for_the_response():
+    planner = BatchPlanner(INSTRUCTION_TOKENS)
+    planner.add(oversized_slide())
+    planner.flush()
+
+    max_tokens = max_output_tokens(planner.report[0]["prompt_tokens"], 1)
+    assert max_tokens >= Config.LLM_OUTPUT_TOKENS_PER_SLIDE
+    assert planner.report[0]["prompt_tokens"] + max_tokens <= Config.LLM_CONTEXT_TOKENS
+
+def test_max_output_tokens_never_drops_below_the_expected_output():
+    assert max_output_tokens(Config.LLM_CONTEXT_TOKENS + 5000, 2) == 2 * Config.LLM_OUTPUT_TOKENS_PER_SLIDE
+
+def test_slides_within_the_budget_are_untouched():
+    slide = {"slide_number": 3, "text": "short", "objects": []}
+    assert fit_slide(slide, slide_tokens(slide)) is slide
+
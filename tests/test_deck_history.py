@@ -0,0 +1,67 @@
+import zipfile
+import pytest
+import deck_history
+from cache import ResultCache
+
+P = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+def write_deck(path, slide_texts, creator, created):
+    """a minimal pptx package: one slide per text, plus core properties"""
+    with zipfile.ZipFile(path, 'w') as package:
+        package.writestr('ppt/presentation.xml', f'<p:presentation xmlns:p="{P}" xmlns:r="{R}"><p:sldIdLst>'
+                         + ''.join(f'<p:sldId id="{256 + idx}" r:id="rId{idx + 1}"/>' for idx in range(len(slide_texts)))
+                         + '</p:sldIdLst></p:presentation>')
+        package.writestr('ppt/_rels/presentation.xml.rels', f'<Relationships xmlns="{REL}">'
+                         + ''.join(f'<Relationship Id="rId{idx + 1}" Type="{R}/slide" Target="slides/slide{idx + 1}.xml"/>' for idx in range(len(slide_texts)))
+                         + '</Relationships>')
+        for idx, text in enumerate(slide_texts):
+            package.writestr(f'ppt/slides/slide{idx + 1}.xml', f'<p:sld xmlns:p="{P}"><p:cSld><p:spTree>{text}</p:spTree></p:cSld></p:sld>')
+        package.writestr('docProps/core.xml', '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+                         'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/">'
+                         f'<dc:creator>{creator}</dc:creator><dcterms:created>{created}</dcterms:created></cp:coreProperties>')
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+    opened = {}
+    def get_cache(namespace, max_bytes=None):
+        if namespace not in opened:
+            opened[namespace] = ResultCache(namespace, directory=str(tmp_path / 'cache'))
+        return opened[namespace]
+    monkeypatch.setattr(deck_history, "get_cache", get_cache)
+
+def upload(path, scripts_by_batch=()):
+    """runs a deck through DeckHistory the way the pipeline does, returns the history"""
+    history = deck_history.DeckHistory(str(path))
+    for numbers in scripts_by_batch:
+        scripts = [{"slide_number": number, "presentation_text": f"script of slide {number}"} for number in numbers]
+        if history.previous_scripts(numbers) is None:
+            history.record_batch(numbers, scripts)
+    history.save()
+    return history
+
+def test_edited_deck_reuses_its_unchanged_batches(tmp_path):
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    write_deck(first / "slides.pptx", ["intro", "agenda", "results"], "ana", "2026-01-05T10:00:00Z")
+    upload(first / "slides.pptx", [[1, 2], [3]])
+    write_deck(second / "slides.pptx", ["intro", "agenda", "new results"], "ana", "2026-01-05T10:00:00Z")
+    history = deck_history.DeckHistory(str(second / "slides.pptx"))
+    assert history.changed_slides() == [3]
+    assert [script["slide_number"] for script in history.previous_scripts([1, 2])] == [1, 2]
+    assert history.previous_scripts([3]) is None
+
+def test_unrelated_deck_with_the_same_name_has_its_own_history(tmp_path):
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    write_deck(first / "slides.pptx", ["intro", "agenda"], "ana", "2026-01-05T10:00:00Z")
+    upload(first / "slides.pptx", [[1, 2]])
+    write_deck(second / "slides.pptx", ["intro", "agenda"], "ben", "2026-03-20T08:30:00Z")
+    history = deck_history.DeckHistory(str(second / "slides.pptx"))
+    assert history.previous is None
+    assert history.previous_scripts([1, 2]) is None
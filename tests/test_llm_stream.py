@@ -0,0 +1,57 @@
+import json
+import time
+import pytest
+
+pytest.importorskip("langchain_nvidia_ai_endpoints")
+pytest.importorskip("dotenv")
+import nvidia_api
+from config import Config
+from benchmarks.bench_pipeline import FakeChatNVIDIA
+
+class ScriptedSession:
+    """stands in for NvidiaSession, streaming a fixed reply in small chunks"""
+    def __init__(self, reply, chunk_size=7):
+        self.reply = reply
+        self.chunk_size = chunk_size
+
+    def stream(self, combined_analysis, context=None, **params):
+        for start in range(0, len(self.reply), self.chunk_size):
+            yield self.reply[start:start + self.chunk_size]
+
+def script(slide_number):
+    return {"slide_number": slide_number, "presentation_text": f"script of slide {slide_number}"}
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_ENABLED", False)
+
+def streamed(reply):
+    slides = [{"slide_number": number} for number in (1, 2, 3)]
+    return list(nvidia_api.stream_with_nvidia_api(slides, max_tokens=1000, session=ScriptedSession(reply)))
+
+def test_array_behind_prose_and_fences():
+    reply = "Here is your presentation:\n```json\n" + json.dumps([script(1), script(2), script(3)]) + "\n```"
+    assert streamed(reply) == [script(1), script(2), script(3)]
+
+def test_bare_objects_are_recovered_when_the_stream_ends():
+    reply = "\n".join(json.dumps(script(number)) for number in (1, 2, 3))
+    assert streamed(reply) == [script(1), script(2), script(3)]
+
+def test_truncated_array_is_not_yielded_twice():
+    reply = json.dumps([script(1), script(2), script(3)])[:-40]
+    assert streamed(reply) == [script(1), script(2)]
+
+def test_each_slide_is_yielded_as_soon_as_it_is_generated():
+    # the first chunk comes after 0.05s, then one slide every 0.2s
+    llm = FakeChatNVIDIA(latency=0.05, slide_latency=0.2, words=20)
+    session = nvidia_api.NvidiaSession(llm=llm)
+    slides = [{"slide_number": number, "text": f"slide {number}"} for number in (1, 2, 3)]
+    start = time.perf_counter()
+    arrivals = []
+    for answer in nvidia_api.stream_with_nvidia_api(slides, max_tokens=1000, session=session):
+        arrivals.append((answer["slide_number"], time.perf_counter() - start))
+    assert [number for number, _ in arrivals] == [1, 2, 3]
+    # slide 1 is handed on long before the whole batch (0.65s) is generated
+    assert arrivals[0][1] < 0.45
+    assert arrivals[-1][1] >= 0.6
+    assert session.stats()["requests"] == 1
@@ -0,0 +1,128 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("langchain_nvidia_ai_endpoints")
+pytest.importorskip("dotenv")
+import nvidia_api
+from config import Config
+
+def fake_client(verify_ssl=True):
+    return SimpleNamespace(_client=SimpleNamespace(get_session_fn=None, verify_ssl=verify_ssl))
+
+def test_each_thread_gets_its_own_client(monkeypatch):
+    monkeypatch.setattr(nvidia_api, "initialize_nvidia_api", lambda base_url=None: fake_client())
+    session = nvidia_api.NvidiaSession()
+    clients = [session.llm]
+    worker = threading.Thread(target=lambda: clients.extend([session.llm, session.llm]))
+    worker.start()
+    worker.join()
+    assert clients[0] is not clients[1]
+    assert clients[1] is clients[2]
+    # connections are still pooled in one http session
+    assert clients[0]._client.get_session_fn() is clients[1]._client.get_session_fn()
+
+def test_pooled_session_keeps_the_ssl_setting(monkeypatch):
+    monkeypatch.setattr(nvidia_api, "initialize_nvidia_api", lambda base_url=None: fake_client(verify_ssl=False))
+    session = nvidia_api.NvidiaSession()
+    assert session.llm._client.get_session_fn().verify is False
+
+class OpenAIStub(ThreadingHTTPServer):
+    """a local OpenAI-compatible chat completions server answering one script per requested slide.
+
+    it records every request's messages and the client port it came in on (one port per
+    connection), and answers the first `failures` requests with a 429.
+    """
+    def __init__(self, failures=0):
+        super().__init__(('127.0.0.1', 0), OpenAIStubHandler)
+        self.failures = failures
+        self.requests = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+class OpenAIStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so a pooled client reuses its connection
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(200, json.dumps({"object": "list", "data": [{"id": Config.NVIDIA_MODEL_NAME, "object": "model"}]}))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append({"port": self.client_address[1], "messages": request["messages"]})
+        if self.server.failures:
+            self.server.failures -= 1
+            self._send(429, json.dumps({"title": "Too Many Requests"}), headers=[("Retry-After", "0")])
+            return
+        payload = request["messages"][-1]["content"]
+        slides = json.loads(payload[payload.index("Input:\n") + len("Input:\n"):])
+        reply = json.dumps([{"slide_number": slide["slide_number"], "presentation_text": f"script of slide {slide['slide_number']}"} for slide in slides])
+        usage = {"prompt_tokens": len(payload) // 4, "completion_tokens": len(reply) // 4, "total_tokens": (len(payload) + len(reply)) // 4}
+        if not request.get("stream"):
+            self._send(200, json.dumps({"id": "stub", "object": "chat.completion", "model": request["model"], "usage": usage,
+                                        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}]}))
+            return
+        events = []
+        for start in range(0, len(reply), 16):
+            events.append({"id": "stub", "object": "chat.completion.chunk", "model": request["model"],
+                           "choices": [{"index": 0, "delta": {"role": "assistant", "content": reply[start:start + 16]}, "finish_reason": None}]})
+        events.append({"id": "stub", "object": "chat.completion.chunk", "model": request["model"], "usage": usage,
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._send(200, "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n", content_type="text/event-stream")
+
+@pytest.fixture
+def openai_stub():
+    server = OpenAIStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def batch(*numbers):
+    return [{"slide_number": number, "text": f"slide {number}"} for number in numbers]
+
+def test_batches_share_the_instruction_prefix_and_one_connection(openai_stub):
+    session = nvidia_api.NvidiaSession(base_url=openai_stub.base_url)
+    for numbers in ((1, 2), (3, 4)):
+        response = session.invoke(batch(*numbers), **nvidia_api.llm_params(1000))
+        assert [script["slide_number"] for script in json.loads(response)] == list(numbers)
+    first, second = openai_stub.requests
+    # the static instructions are a system message of their own, byte-identical in every request
+    assert first["messages"][0] == second["messages"][0] == {"role": "system", "content": nvidia_api.INSTRUCTIONS}
+    assert first["port"] == second["port"]
+    stats = session.stats()
+    assert stats["requests"] == 2 and stats["errors"] == 0
+    assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] > 0
+    assert all(request["latency"] > 0 for request in stats["recent"])
+
+def test_rate_limited_request_is_retried(openai_stub, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_RETRY_BACKOFF", 0.01)
+    openai_stub.failures = 1
+    session = nvidia_api.NvidiaSession(base_url=openai_stub.base_url)
+    session.invoke(batch(1), **nvidia_api.llm_params(1000))
+    assert len(openai_stub.requests) == 2
+    assert session.stats()["retries"] == 1
+
+def test_streamed_batch_through_the_stub(openai_stub, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_ENABLED", False)
+    session = nvidia_api.NvidiaSession(base_url=openai_stub.base_url)
+    scripts = list(nvidia_api.stream_with_nvidia_api(batch(1, 2, 3), max_tokens=1000, session=session))
+    assert [script["slide_number"] for script in scripts] == [1, 2, 3]
+    assert session.stats()["completion_tokens"] > 0
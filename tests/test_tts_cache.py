@@ -0,0 +1,49 @@
+import time
+import pytest
+import tts_cache
+from cache import ResultCache
+from benchmarks.bench_pipeline import FakeTTS
+
+VOICE = {"name": "en-US-Neural2-D", "language_code": "en-US", "encoding": "LINEAR16"}
+
+@pytest.fixture
+def tts_cache_dir(tmp_path, monkeypatch):
+    """a fresh tts cache under tmp_path, returns a function that sets its byte budget"""
+    budget = {"max_bytes": 1024 * 1024}
+    caches = {}
+    def get_cache(namespace, max_bytes):
+        if namespace not in caches:
+            caches[namespace] = ResultCache(namespace, directory=str(tmp_path / 'cache'), max_bytes=budget["max_bytes"])
+        return caches[namespace]
+    monkeypatch.setattr(tts_cache, "get_cache", get_cache)
+    return budget
+
+@pytest.fixture
+def tts():
+    return FakeTTS(latency=0, words_per_second=2.5, samplerate=8000)
+
+def test_repeated_text_is_synthesized_once(tts_cache_dir, tts, tmp_path):
+    first = tmp_path / "first.wav"
+    second = tmp_path / "second.wav"
+    assert not tts_cache.synthesize_to_file("google", "welcome to the talk", VOICE, tts.synthesize, str(first))
+    assert tts_cache.synthesize_to_file("google", "welcome to the talk", VOICE, tts.synthesize, str(second))
+    assert tts.calls == 1
+    assert first.read_bytes() == second.read_bytes()
+
+def test_voice_and_engine_are_part_of_the_key(tts_cache_dir, tts):
+    tts_cache.synthesize_bytes("google", "welcome to the talk", VOICE, tts.synthesize)
+    tts_cache.synthesize_bytes("google", "welcome to the talk", {**VOICE, "name": "en-US-Neural2-F"}, tts.synthesize)
+    tts_cache.synthesize_bytes("elevenlabs", "welcome to the talk", VOICE, tts.synthesize)
+    assert tts.calls == 3
+
+def test_least_recently_used_audio_is_evicted_by_size(tts_cache_dir, tts):
+    audio_bytes = len(tts.synthesize("one two three four five"))
+    tts.calls = 0
+    tts_cache_dir["max_bytes"] = 2 * audio_bytes  # room for two clips of the same length
+    for text in ("one two three four five", "six seven eight nine ten", "one two three four five", "ten nine eight seven six"):
+        tts_cache.synthesize_bytes("google", text, VOICE, tts.synthesize)
+        time.sleep(0.02)  # file times are only as fine as the kernel's clock tick
+    assert tts.calls == 3
+    # the second clip was the least recently used one
+    _, cached = tts_cache.synthesize_bytes("google", "six seven eight nine ten", VOICE, tts.synthesize)
+    assert not cached